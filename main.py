@@ -14,16 +14,19 @@ _log = get_log()
 HELLOWORDS = ["哈咯","Hi","测试","哈喽","Hello","剧剧"]
 VERSION = "1.0"
 bot_qq = "3044829389"
+BOT_QQ_INT = int(bot_qq)
 
 # ========= 注册回调函数 ==========
 @bot.group_event()
 async def on_group_message(msg: GroupMessage):
-    if int(msg.user_id) != int(bot_qq):
+    uid = msg.user_id
+    if (uid if type(uid) is int else int(uid)) != BOT_QQ_INT:
         _log.info(msg)
 
 @bot.private_event()
 async def on_private_message(msg: PrivateMessage):
-    if int(msg.user_id) != int(bot_qq):
+    uid = msg.user_id
+    if (uid if type(uid) is int else int(uid)) != BOT_QQ_INT:
         _log.info(msg)
         
 
@@ -77,6 +80,29 @@ if __name__ == "__main__":
     except Exception:
         pass
 
+    # Route log records through an in-memory queue; handler I/O runs on listener threads
+    try:
+        import atexit
+        import queue
+        from logging.handlers import QueueHandler, QueueListener
+
+        _logger = _log
+        while _logger is not None:
+            _handlers = [h for h in _logger.handlers if not isinstance(h, QueueHandler)]
+            if _handlers:
+                _log_queue = queue.Queue(maxsize=10000)
+                for h in _handlers:
+                    _logger.removeHandler(h)
+                _logger.addHandler(QueueHandler(_log_queue))
+                _listener = QueueListener(_log_queue, *_handlers, respect_handler_level=True)
+                _listener.start()
+                atexit.register(_listener.stop)
+            if not _logger.propagate:
+                break
+            _logger = _logger.parent
+    except Exception as e:
+        _log.error("[logging] failed to install queue handlers: %s", e)
+
     # Hook Route.post to catch NapCat send failures (retcode=1200 + "网络连接异常") and trigger system restart
     try:
         if hasattr(Route, "post"):
@@ -84,10 +110,10 @@ if __name__ == "__main__":
 
             async def _patched_route_post(self, *args, **kwargs):
                 res = await _orig_route_post(self, *args, **kwargs)
-                if isinstance(res, dict):
-                    retcode = res.get("retcode")
+                # Happy path: retcode is almost always 0, so check it before building the message
+                if isinstance(res, dict) and res.get("retcode") in (1200, "1200"):
                     msg = res.get("msg") or res.get("wording") or res.get("message") or ""
-                    if str(retcode) == "1200" and "网络连接异常" in str(msg):
+                    if "网络连接异常" in str(msg):
                         restart_cmd = os.environ.get("NAPCAT_RESTART_CMD", "systemctl restart napcat")
                         _log.warning("[auto-restart] detected send failure, executing: %s", restart_cmd)
                         try:
@@ -1,6 +1,9 @@
 import json
 import os
 import asyncio
+import atexit
+import shutil
+import tempfile
 import traceback
 from ncatbot.utils.logger import get_log
 
@@ -8,6 +11,8 @@ log = get_log()
 
 class BaseDataManager:
     
+    save_interval = 30  # 标记修改后合并写盘的间隔（秒）
+    
     def __init__(self, file_path, *args, **kwargs):
         if hasattr(self, "_initialized") and self._initialized:
             return
@@ -15,6 +20,10 @@ class BaseDataManager:
         self.file_path = file_path or f"{self.work_path}{self.__class__.__name__}.json"
         self.data = {}
         self.updating = False
+        self._dirty = False
+        self._save_task = None
+        self._save_lock = asyncio.Lock()  # 串行化 save()，避免并发保存交错写入与备份
+        atexit.register(self._flush_on_exit)
         self.__on_load()
         self.on_load(*args, **kwargs)
         self._initialized = True
@@ -61,25 +70,18 @@ class BaseDataManager:
                     await self._wait_for_data_update()
                 else:
                     return {"success":False, "updating":True}
-            # 备份机制：保存前先备份原文件
-            if os.path.exists(self.file_path):
-                backup_path = self.file_path + ".bak"
-                try:
-                    # 如果已有备份，先删除
-                    if os.path.exists(backup_path):
-                        os.remove(backup_path)
-                    os.rename(self.file_path, backup_path)
-                except Exception as e:
-                    print(f"备份原数据文件失败: {e}")
-            # 正式写入新数据
-            with open(self.file_path, "w", encoding="utf-8") as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=4)
-                return {"success":True, "updating":False}
+            async with self._save_lock:
+                # 在事件循环内序列化以获得一致的快照，文件写入放到线程中执行
+                payload = self._dumps()
+                self._dirty = False
+                await asyncio.to_thread(self._atomic_write, payload)
+            return {"success":True, "updating":False}
         except Exception as e:
+            self._dirty = True
             traceback.print_exc()
             # 如果写入失败，尝试恢复备份
             backup_path = self.file_path + ".bak"
-            if os.path.exists(backup_path):
+            if not os.path.exists(self.file_path) and os.path.exists(backup_path):
                 try:
                     os.rename(backup_path, self.file_path)
                     print("已自动恢复备份数据文件！")
@@ -87,6 +89,68 @@ class BaseDataManager:
                     print(f"恢复备份失败: {e2}")
             raise RuntimeError(f"保存持久化数据时出错: {e}")
         
+    def _atomic_write(self, payload):
+        """
+        先写入唯一命名的临时文件，再原子替换正式文件；原文件另存为 .bak 备份，替换过程中正式文件始终存在
+        """
+        directory = os.path.dirname(self.file_path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.file_path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(payload)
+            if os.path.exists(self.file_path):
+                # mkstemp 创建的文件权限为 0600，沿用原文件的权限
+                shutil.copymode(self.file_path, tmp_path)
+            # 备份机制：替换前先复制一份原文件（优先硬链接，不移动原文件）
+            if os.path.exists(self.file_path):
+                backup_path = self.file_path + ".bak"
+                try:
+                    if os.path.exists(backup_path):
+                        os.remove(backup_path)
+                    try:
+                        os.link(self.file_path, backup_path)
+                    except OSError:
+                        shutil.copy2(self.file_path, backup_path)
+                except Exception as e:
+                    print(f"备份原数据文件失败: {e}")
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    
+    def mark_dirty(self):
+        """
+        标记数据已修改，由后台任务在 save_interval 秒后合并写盘
+        """
+        self._dirty = True
+        if self._save_task is None or self._save_task.done():
+            try:
+                self._save_task = asyncio.get_running_loop().create_task(self._save_loop())
+            except RuntimeError:
+                # 没有运行中的事件循环，交由显式 save() 或退出时保存
+                pass
+    
+    async def _save_loop(self):
+        while self._dirty:
+            await asyncio.sleep(self.save_interval)
+            if self._dirty:
+                try:
+                    await self.save()
+                except Exception:
+                    traceback.print_exc()
+    
+    def _flush_on_exit(self):
+        if not self._dirty:
+            return
+        try:
+            self._atomic_write(self._dumps())
+            self._dirty = False
+        except Exception:
+            traceback.print_exc()
+        
     async def _wait_for_data_update(self):
         """
         等待数据更新完成，直到self.updating为False
@@ -97,6 +161,18 @@ class BaseDataManager:
     def on_load(self, *args, **kwargs):
         pass
     
+    def _serialize(self, data):
+        """
+        保存前将内存中的数据转换为可JSON序列化的结构，子类可按需覆盖
+        """
+        return data
+    
+    def _dumps(self):
+        """
+        生成写入文件的 json 文本，子类可覆盖以复用未变化部分的序列化结果
+        """
+        return json.dumps(self._serialize(self.data), ensure_ascii=False, indent=4)
+    
     def __new__(cls, *args, **kwargs):
         if not hasattr(cls, "_instance"):
             cls._instance = super().__new__(cls)
@@ -1,26 +1,125 @@
+import asyncio
+import functools
+import json
+from collections import defaultdict
+from collections.abc import Mapping
+import time
 from datetime import datetime
 from plugins.AdminPlugin.BaseDataManager import BaseDataManager
 from ncatbot.plugin import BasePlugin
 from ncatbot.utils.logger import get_log
-from copy import deepcopy
+from plugins.AdminPlugin._fastcopy import naive_deepcopy
+from types import MappingProxyType
 log = get_log()
 
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# 当前时间字符串缓存 [整秒时间戳, 格式化结果]，同一秒内的批量写入复用同一结果
+_current_ts = [0, "1970-01-01 00:00:00"]
+# 批量调用 bot API（点赞、私聊提醒）时的最大并发数，避免触发限流
+API_CONCURRENCY = 8
+
+# 用户数据模板，USER_MODEL() 基于此生成新用户，可变字段在工厂函数中单独新建
+_USER_MODEL_TEMPLATE = {
+    "activate": True,
+    "attention_to_hulaquan": 0,
+    "chats_count": 0,
+    # 订阅权限
+    "subscribe": {
+        "is_subscribe": False,
+        "subscribe_time": None,
+        "subscribe_tickets": [],
+        "subscribe_events": [],
+        "subscribe_actors": [],  # [{actor: str, actor_key: str, mode: int}]
+    },
+}
+
+def _flatten_model(model, prefix=()):
+    paths = []
+    for k, v in model.items():
+        if type(v) is dict and v:
+            paths.extend(_flatten_model(v, prefix + (k,)))
+        else:
+            paths.append((prefix + (k,), v))
+    return paths
+
+# 用户模板展开为 [(键路径, 默认值)]，update_user_keys 据此逐项补齐旧用户缺失的字段
+_MODEL_PATHS = _flatten_model(_USER_MODEL_TEMPLATE)
+
+# 订阅列表 -> 内存索引键名 {条目键: 下标}；索引可随时重建，保存时不写入文件
+_SUBSCRIBE_INDEX_KEYS = {
+    "subscribe_tickets": "_ticket_index",
+    "subscribe_events": "_event_index",
+    "subscribe_actors": "_actor_index",
+}
+
+def _now_str():
+    """当前时间字符串（不经缓存）"""
+    return datetime.now().strftime(TIME_FORMAT)
+
+def _cached_now_str():
+    """当前时间字符串，每秒最多格式化一次"""
+    sec = int(time.time())
+    if sec != _current_ts[0]:
+        _current_ts[1] = _now_str()
+        _current_ts[0] = sec
+    return _current_ts[1]
+
+@functools.lru_cache(maxsize=4096, typed=True)
+def _str_id(raw_id):
+    return str(raw_id)
+
+def _to_str_id(raw_id):
+    """QQ 号/群号统一为字符串；非字符串的转换结果经 LRU 缓存复用"""
+    return raw_id if type(raw_id) is str else _str_id(raw_id)
+
+def _actor_key(actor_name):
+    """演员名的标准化形式（去空白、小写），写入时计算一次并随数据保存"""
+    return str(actor_name).strip().lower()
+
+def _subscribe_entry_key(list_key, entry):
+    if list_key == "subscribe_actors":
+        return entry.get('actor_key') or _actor_key(entry.get('actor', ''))
+    return str(entry.get('id'))
+
+class _ReadOnlyView(Mapping):
+    """
+    dict 的只读实时视图：读取到的嵌套 dict 同样包装为只读视图，list 转为 tuple
+    users() 返回的用户数据经此包装，调用方无法绕过 mark_dirty() 直接改动用户数据
+    """
+    __slots__ = ("_d",)
+
+    def __init__(self, d):
+        self._d = d
+
+    def __getitem__(self, key):
+        return _read_only(self._d[key])
+
+    def __iter__(self):
+        return iter(self._d)
+
+    def __len__(self):
+        return len(self._d)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._d!r})"
+
+def _read_only(value):
+    t = type(value)
+    if t is dict:
+        return _ReadOnlyView(value)
+    if t is list:
+        return tuple(_read_only(v) for v in value)
+    return value
+
 def USER_MODEL():
-        model = {
-        "activate": True,
-        "create_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "attention_to_hulaquan": 0,
-        "chats_count":0,
-        # 订阅权限
-        "subscribe": {
-            "is_subscribe": False,
-            "subscribe_time": None,
-            "subscribe_tickets": [],
-            "subscribe_events": [],
-            "subscribe_actors": [],  # [{actor: str, mode: int}]
-            }
-        }
-        return model
+    model = {**_USER_MODEL_TEMPLATE, "create_time": _cached_now_str()}
+    model["subscribe"] = {
+        **_USER_MODEL_TEMPLATE["subscribe"],
+        "subscribe_tickets": [],
+        "subscribe_events": [],
+        "subscribe_actors": [],
+    }
+    return model
 
 
 class UsersManager(BaseDataManager):
@@ -34,90 +133,279 @@ class UsersManager(BaseDataManager):
 
 
     def on_load(self, data=None):
+        # 只读快照缓存：结构变化时递增版本号，读取时按版本号判断是否需要重建
+        self._users_version = 0
+        self._snapshots = {}
+        # 每个用户序列化结果的缓存 {user_id: json 片段}，用户数据变化时丢弃对应条目
+        self._user_blobs = {}
+        self._dumps_verified = False  # 拼接结果是否已与完整序列化比对过
+        # 私聊计数的待写入增量 {user_id: n}，保存前统一并入用户数据
+        self._pending_chats = defaultdict(int)
         first_init = False
         if data:
             first_init = True
             self.data["users"] = data["users"]
-            self.data["users_list"] = data["users_list"]
-            self.data["ops_list"] = data["ops_list"]
+            self.data["users_list"] = set(data["users_list"])
+            self.data["ops_list"] = set(data["ops_list"])
             self.data["groups"] = data["groups"]
-            self.data["groups_list"] = data["groups_list"]
+            self.data["groups_list"] = set(data["groups_list"])
             print(len(self.data["users_list"]))
             return super().on_load()
         if "users" not in self.data:
             self.data["users"] = data["users"] if first_init else {}
-        if "users_list" not in self.data:
-            self.data["users_list"] = data["users_list"] if first_init else []
-        if "ops_list" not in self.data:
-            self.data["ops_list"] = data["ops_list"] if first_init else []
+        # id 列表在内存中以 set 保存，成员判断/删除为 O(1)；保存时再转回有序列表
+        self.data["users_list"] = set(self.data.get("users_list", []))
+        self.data["ops_list"] = set(self.data.get("ops_list", []))
         if "groups" not in self.data:
             self.data["groups"] = data["groups"] if first_init else {}
-        if "groups_list" not in self.data:
-            self.data["groups_list"] = data["groups_list"] if first_init else []
+        self.data["groups_list"] = set(self.data.get("groups_list", []))
         self.data.setdefault("todays_likes", [])
         # 点赞功能开关（默认关闭）
         self.data.setdefault("like_enabled", False)
+        self._backfill_actor_keys()
         return super().on_load()
     
+    def _backfill_actor_keys(self):
+        """
+        旧数据迁移：为演员订阅补充 actor_key，为场次的 related_to_actors 补充对应的 related_actor_keys
+        """
+        for user in self.data["users"].values():
+            sub = user.get("subscribe")
+            if not sub:
+                continue
+            for actor in sub.get("subscribe_actors", []):
+                if "actor_key" not in actor:
+                    actor["actor_key"] = _actor_key(actor.get("actor", ""))
+            for ticket in sub.get("subscribe_tickets", []):
+                related_actors = ticket.get("related_to_actors")
+                if isinstance(related_actors, list) and len(ticket.get("related_actor_keys", ())) != len(related_actors):
+                    ticket["related_actor_keys"] = [_actor_key(a) for a in related_actors]
+    
+    def _dumps_from_blobs(self):
+        """
+        拼接保存内容：未变化的用户直接复用缓存的 json 片段，只重新序列化有改动的用户
+        """
+        self._flush_chats_counts()
+        users = self.data.get("users", {})
+        blobs = self._user_blobs
+        if len(blobs) > len(users):
+            for user_id in blobs.keys() - users.keys():
+                del blobs[user_id]
+        parts = []
+        for user_id, user in users.items():
+            blob = blobs.get(user_id)
+            if blob is None:
+                # 用户位于第二层，续行缩进 8 格，与整体 indent=4 的输出保持一致
+                blob = json.dumps(self._strip_runtime_keys(user), ensure_ascii=False, indent=4).replace("\n", "\n        ")
+                blobs[user_id] = blob
+            parts.append(f"        {json.dumps(user_id, ensure_ascii=False)}: {blob}")
+        users_json = "{\n" + ",\n".join(parts) + "\n    }" if parts else "{}"
+        # 其余字段体量小，每次整体序列化；id 集合转回有序列表
+        rest = {k: sorted(v) if isinstance(v, set) else v for k, v in self.data.items() if k != "users"}
+        if not rest:
+            return '{\n    "users": ' + users_json + '\n}'
+        head = json.dumps(rest, ensure_ascii=False, indent=4)
+        return head[:-2] + ',\n    "users": ' + users_json + '\n}'
+    
+    def _serialize(self, data):
+        """
+        可直接 json 序列化的完整数据：id 集合转为有序列表，去掉订阅中的运行时索引
+        """
+        out = {k: sorted(v) if isinstance(v, set) else v for k, v in data.items() if k != "users"}
+        out["users"] = {user_id: self._strip_runtime_keys(user) for user_id, user in data.get("users", {}).items()}
+        return out
+    
+    def _dumps(self):
+        """
+        首次保存时校验拼接结果与完整序列化一致；不一致时记录错误并改为整体序列化
+        """
+        if self._dumps_verified:
+            return self._dumps_from_blobs()
+        payload = self._dumps_from_blobs()
+        full = json.dumps(self._serialize(self.data), ensure_ascii=False, indent=4)
+        if json.loads(payload) != json.loads(full):
+            log.error("UsersManager 拼接的保存内容与完整序列化不一致，已丢弃用户缓存并改为整体序列化")
+            self._user_blobs.clear()
+            return full
+        self._dumps_verified = True
+        return payload
+    
+    def mark_dirty(self, user_id=None):
+        """
+        标记数据已修改；user_id 为 None 时无法确定改动范围，丢弃全部用户缓存
+        """
+        if user_id is None:
+            self._user_blobs.clear()
+        else:
+            self._user_blobs.pop(user_id, None)
+        super().mark_dirty()
+    
+    @staticmethod
+    def _strip_runtime_keys(user):
+        sub = user.get("subscribe")
+        if not sub or not any(k.startswith("_") for k in sub):
+            return user
+        return {**user, "subscribe": {k: v for k, v in sub.items() if not k.startswith("_")}}
+    
+    def _rebuild_subscribe_index(self, sub, list_key):
+        """
+        重建订阅列表的索引；重复条目索引指向第一条，列表本身不做改动
+        """
+        entries = sub.setdefault(list_key, [])
+        index = {}
+        for pos, entry in enumerate(entries):
+            index.setdefault(_subscribe_entry_key(list_key, entry), pos)
+        if len(index) != len(entries):
+            log.warning(f"订阅列表 {list_key} 中有 {len(entries) - len(index)} 条重复条目，已保留原数据")
+        sub[_SUBSCRIBE_INDEX_KEYS[list_key]] = index
+        return index
+    
+    @staticmethod
+    def _invalidate_subscribe_index(sub, list_key):
+        """订阅列表被整体替换后调用，下次访问时重建索引"""
+        sub.pop(_SUBSCRIBE_INDEX_KEYS[list_key], None)
+    
+    def _subscribe_index(self, sub, list_key):
+        index = sub.get(_SUBSCRIBE_INDEX_KEYS[list_key])
+        if index is None:
+            index = self._rebuild_subscribe_index(sub, list_key)
+        return index
+    
+    def _append_subscribe_entry(self, sub, list_key, entry, user_id=None):
+        index = self._subscribe_index(sub, list_key)
+        entries = sub.setdefault(list_key, [])
+        index.setdefault(_subscribe_entry_key(list_key, entry), len(entries))
+        entries.append(entry)
+        self.mark_dirty(user_id)
+    
+    def _upsert_subscribe_entry(self, sub, list_key, entry, user_id=None):
+        """
+        已有同键条目时原地更新字段，否则追加，避免重复订阅
+        """
+        existing = self._find_subscribe_entry(sub, list_key, _subscribe_entry_key(list_key, entry))
+        if existing is None:
+            self._append_subscribe_entry(sub, list_key, entry, user_id)
+        else:
+            existing.update(entry)
+            self.mark_dirty(user_id)
+    
+    def _find_subscribe_entry(self, sub, list_key, key):
+        pos = self._subscribe_index(sub, list_key).get(key)
+        return None if pos is None else sub[list_key][pos]
+    
+    def _remove_subscribe_entry(self, sub, list_key, key, user_id=None):
+        """
+        删除条目并保持其余条目的顺序（查看关注列表时按存储顺序编号），其后条目的下标在索引中前移一位
+        """
+        index = self._subscribe_index(sub, list_key)
+        pos = index.pop(key, None)
+        if pos is None:
+            return False
+        entries = sub[list_key]
+        if len(index) + 1 != len(entries):
+            # 列表中有重复条目：与旧逻辑一致，移除该键的全部条目后重建索引
+            entries[:] = [e for e in entries if _subscribe_entry_key(list_key, e) != key]
+            self._rebuild_subscribe_index(sub, list_key)
+        else:
+            del entries[pos]
+            for k, p in index.items():
+                if p > pos:
+                    index[k] = p - 1
+        self.mark_dirty(user_id)
+        return True
     
+    def _touch(self):
+        """标记用户/群组结构已变化，使只读快照失效"""
+        self._users_version += 1
+        super().mark_dirty()
+
+    def _snapshot(self, key, factory, default):
+        cached = self._snapshots.get(key)
+        if cached is None or cached[0] != self._users_version:
+            cached = (self._users_version, factory(self.data.get(key, default)))
+            self._snapshots[key] = cached
+        return cached[1]
         
     def users(self):
-        return deepcopy(self.data.get("users", {}))
+        """
+        返回用户字典的只读快照（结构变化后才重建），各用户数据为实时的只读视图
+        需要修改返回值时请使用 users_mutable_copy()
+        """
+        return self._snapshot("users", lambda d: MappingProxyType({k: _ReadOnlyView(v) for k, v in d.items()}), {})
+    
+    def users_mutable_copy(self):
+        return naive_deepcopy(self.data.get("users", {}))
         
     def users_list(self):
-        return deepcopy(self.data.get("users_list", []))
+        return self._snapshot("users_list", tuple, [])
+    
+    def iter_users(self):
+        """
+        逐个产出用户 id，基于只读快照，遍历期间增删用户不影响本次遍历
+        """
+        yield from self.users_list()
     
     def ops_list(self):
         return self.data.get("ops_list", [])
     
     def groups(self):
-        return deepcopy(self.data.get("groups", {}))
+        return self._snapshot("groups", lambda d: MappingProxyType(dict(d)), {})
+    
+    def groups_mutable_copy(self):
+        return naive_deepcopy(self.data.get("groups", {}))
         
     def groups_list(self):
-        return deepcopy(self.data.get("groups_list", []))
+        return self._snapshot("groups_list", tuple, [])
         
     def add_group(self, group_id):
-        if not isinstance(group_id, str):
-            group_id = str(group_id)
+        group_id = _to_str_id(group_id)
         if group_id in self.data["groups_list"]:
             return
-        self.data["groups_list"].append(group_id)
+        self._touch()
+        self.data["groups_list"].add(group_id)
         self.data["groups"][group_id] = {
             "activate": True,
-            "create_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "create_time": _cached_now_str(),
             "attention_to_hulaquan": 0,
         }
     
     def delete_group(self, group_id):
-        if not isinstance(group_id, str):
-            group_id = str(group_id)
+        group_id = _to_str_id(group_id)
         if group_id in self.data["groups_list"]:
+            self._touch()
             self.data["groups_list"].remove(group_id)
             del self.data["groups"][group_id]
         
     def add_user(self, user_id):
-        if not isinstance(user_id, str):
-            user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         if user_id in self.data["users_list"]:
             return
-        self.data["users_list"].append(user_id)
+        self._touch()
+        self.data["users_list"].add(user_id)
         self.data["users"][user_id] = USER_MODEL()
         return self.data["users"][user_id]
         
     def update_user_keys(self, user_id):
-        user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         user = self.data["users"].get(user_id, None)
         if user is None:
             return self.add_user(user_id)
         
-        def goto(origin, model):
-            for k, v in model.items():
-                if k not in origin:
-                    origin[k] = v
-                elif isinstance(v, dict):
-                    goto(origin[k], v)
-            
-        goto(user, USER_MODEL())
+        changed = False
+        for path, default in _MODEL_PATHS:
+            node = user
+            for k in path[:-1]:
+                node = node.setdefault(k, {})
+            if path[-1] not in node:
+                node[path[-1]] = default.copy() if type(default) in (list, dict) else default
+                if path[-1] in _SUBSCRIBE_INDEX_KEYS:
+                    self._invalidate_subscribe_index(node, path[-1])
+                changed = True
+        if "create_time" not in user:
+            user["create_time"] = _cached_now_str()
+            changed = True
+        if changed:
+            self.mark_dirty(user_id)
     
     def attention_to_hulaquan(self, user_id, default=0):
         """
@@ -128,68 +416,87 @@ class UsersManager(BaseDataManager):
                
         
     def add_chats_count(self, user_id):
-        if not isinstance(user_id, str):
-            user_id = str(user_id)
+        user_id = _to_str_id(user_id)
+        self._flush_chats_counts()
         if "chats_count" not in self.data['users'][user_id]:
             self.data["users"][user_id]["chats_count"] = 0
         self.data["users"][user_id]["chats_count"] += 1
+        self.mark_dirty(user_id)
         return self.data["users"][user_id]
     
+    def touch_user(self, user_id):
+        """
+        私聊消息入口：用户不存在时创建，并累加聊天次数（合并 add_user + add_chats_count）
+        已有用户的计数先记在内存增量里，保存时再合并，刷屏时不必每条消息都作废用户缓存
+        """
+        user_id = _to_str_id(user_id)
+        if user_id not in self.data["users"]:
+            self.add_user(user_id)
+            self.data["users"].setdefault(user_id, USER_MODEL())
+        self._pending_chats[user_id] += 1
+        super().mark_dirty()
+    
+    def _flush_chats_counts(self):
+        if not self._pending_chats:
+            return
+        pending, self._pending_chats = self._pending_chats, defaultdict(int)
+        users = self.data["users"]
+        for user_id, n in pending.items():
+            user = users.get(user_id)
+            if user is None:
+                continue
+            user["chats_count"] = user.get("chats_count", 0) + n
+            self._user_blobs.pop(user_id, None)
+    
     def delete_user(self, user_id):
-        if not isinstance(user_id, str):
-            user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         if user_id in self.data["users_list"]:
+            self._touch()
             self.data["users_list"].remove(user_id)
             del self.data["users"][user_id]
             
     def add_op(self, user_id):
-        if not isinstance(user_id, str):
-            user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         if user_id in self.data["ops_list"]:
             
             return False
         if user_id not in self.data["users_list"]:
             self.add_user(user_id)
-        self.data["ops_list"].append(user_id)
+        self._touch()
+        self.data["ops_list"].add(user_id)
         self.data["users"][user_id]["is_op"] = True
+        self.mark_dirty(user_id)
         return True
         
     def de_op(self, user_id):
-        if not isinstance(user_id, str):
-            user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         if user_id in self.data["ops_list"]:
+            self._touch()
             self.data["ops_list"].remove(user_id)
             self.data["users"][user_id]["is_op"] = False
+            self.mark_dirty(user_id)
             return True
         return False
             
     def is_op(self, user_id):
-        if not isinstance(user_id, str):
-            user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         if user_id in self.data["ops_list"]:
             return True
         return False
     
     def remove_ticket_subscribe(self, user_id, ticket_id):
-        user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         ticket_id = str(ticket_id)
-        tickets = self.data["users"][user_id]["subscribe"].setdefault("subscribe_tickets", [])
-        before = len(tickets)
-        self.data["users"][user_id]["subscribe"]["subscribe_tickets"] = [t for t in tickets if str(t['id']) != ticket_id]
-        return before != len(self.data["users"][user_id]["subscribe"]["subscribe_tickets"])
+        return self._remove_subscribe_entry(self.data["users"][user_id]["subscribe"], "subscribe_tickets", ticket_id, user_id)
 
     def remove_event_subscribe(self, user_id, event_id):
-        user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         event_id = str(event_id)
-        events = self.data["users"][user_id]["subscribe"].setdefault("subscribe_events", [])
-        before = len(events)
-        self.data["users"][user_id]["subscribe"]["subscribe_events"] = [e for e in events if str(e['id']) != event_id]
-        return before != len(self.data["users"][user_id]["subscribe"]["subscribe_events"])
+        return self._remove_subscribe_entry(self.data["users"][user_id]["subscribe"], "subscribe_events", event_id, user_id)
     
     def switch_attention_to_hulaquan(self, user_id, mode=0, is_group=False):
         # mode = 0: 取消推送，mode = 1: 关注更新，mode = 2：关注一切推送（更新或无更新）
-        if not isinstance(user_id, str):
-            user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         key = "users" if not is_group else "groups"
         try:
             self.data[key][user_id]["attention_to_hulaquan"] = mode
@@ -199,18 +506,22 @@ class UsersManager(BaseDataManager):
             else:
                 self.add_group(user_id)
             self.data[key][user_id]["attention_to_hulaquan"] = mode
+        if is_group:
+            super().mark_dirty()
+        else:
+            self.mark_dirty(user_id)
         return mode
     
     def new_subscribe(self, user_id, is_subscribe=False):
-        if not isinstance(user_id, str):
-            user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         if user_id not in self.data["users_list"]:
             self.add_user(user_id)
         self.data["users"][user_id]["subscribe"]["is_subscribe"] = True if self.data["users"][user_id]["subscribe"]["is_subscribe"] else is_subscribe
-        self.data["users"][user_id]["subscribe"].setdefault("subscribe_time", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        self.data["users"][user_id]["subscribe"].setdefault("subscribe_time", _cached_now_str())
         self.data["users"][user_id]["subscribe"].setdefault("subscribe_tickets", [])
         self.data["users"][user_id]["subscribe"].setdefault("subscribe_events", [])
         self.data["users"][user_id]["subscribe"].setdefault("subscribe_actors", [])  # 确保演员订阅字段存在
+        self.mark_dirty(user_id)
         return self.data["users"][user_id]["subscribe"]
    
     def add_ticket_subscribe(self, user_id, ticket_ids, mode, related_to_actors=None):
@@ -226,9 +537,8 @@ class UsersManager(BaseDataManager):
                              - []: 空列表（暂时不应该出现，会被转换为None）
                              - ['actor1', 'actor2']: 因关注这些演员而订阅的场次
         """
-        user_id = str(user_id)
-        self.data["users"][user_id]["subscribe"].setdefault("subscribe_tickets", [])
-        if user_id not in self.users_list():
+        user_id = _to_str_id(user_id)
+        if user_id not in self.data["users_list"]:
             self.add_user(user_id)
         if isinstance(ticket_ids, int) or isinstance(ticket_ids, str):
             ticket_ids = [ticket_ids]
@@ -241,46 +551,79 @@ class UsersManager(BaseDataManager):
             if not related_to_actors:
                 related_to_actors = None
         
+        sub = self.data["users"][user_id]["subscribe"]
         for i in ticket_ids:
+            ticket_id = str(i)
+            ticket = self._find_subscribe_entry(sub, "subscribe_tickets", ticket_id)
+            if ticket is not None:
+                # 已订阅的场次原地更新，不重复追加
+                ticket['mode'] = mode
+                if related_to_actors is None:
+                    # 转为手动订阅，之后取消关注演员时不再连带移除
+                    ticket.pop('related_to_actors', None)
+                    ticket.pop('related_actor_keys', None)
+                elif ticket.get('related_to_actors') is not None:
+                    for actor_name in related_to_actors:
+                        self.add_actor_to_ticket_relation(user_id, ticket_id, actor_name)
+                self.mark_dirty(user_id)
+                continue
             ticket_entry = {
-                'id': str(i),
+                'id': ticket_id,
                 'mode': mode
             }
             # 只有非None时才添加字段
             if related_to_actors is not None:
-                ticket_entry['related_to_actors'] = related_to_actors
+                ticket_entry['related_to_actors'] = list(related_to_actors)
+                ticket_entry['related_actor_keys'] = [_actor_key(a) for a in related_to_actors]
             
-            self.data["users"][user_id]["subscribe"]["subscribe_tickets"].append(ticket_entry)
+            self._append_subscribe_entry(sub, "subscribe_tickets", ticket_entry, user_id)
         return True
     
     def add_event_subscribe(self, user_id, event_ids, mode):
-        user_id = str(user_id)
-        self.data["users"][user_id]["subscribe"].setdefault("subscribe_events", [])
-        if user_id not in self.users_list():
+        user_id = _to_str_id(user_id)
+        if user_id not in self.data["users_list"]:
             self.add_user(user_id)
         if isinstance(event_ids, int) or isinstance(event_ids, str):
             event_ids = [event_ids]
+        sub = self.data["users"][user_id]["subscribe"]
         for i in event_ids:
-            self.data["users"][user_id]["subscribe"]["subscribe_events"].append(
-                {
+            self._upsert_subscribe_entry(sub, "subscribe_events", {
                 'id': str(i),
                 'mode': mode,
-                })
+                }, user_id)
         return True
     
+    def _subscribe_list(self, user_id, list_key):
+        """
+        读取订阅列表的副本；仅在用户或字段缺失时才走 new_subscribe 补全
+        返回副本而非原列表，修改订阅须经由 add_*/remove_*/update_* 方法，以便作废该用户的保存缓存
+        """
+        user_id = _to_str_id(user_id)
+        user = self.data["users"].get(user_id)
+        sub = user.get("subscribe") if user is not None else None
+        if sub is None or list_key not in sub:
+            self.new_subscribe(user_id)
+            sub = self.data["users"][user_id]["subscribe"]
+        return naive_deepcopy(sub[list_key])
+    
     def subscribe_tickets(self, user_id):
-        self.new_subscribe(user_id)
-        return self.data["users"][user_id]["subscribe"]["subscribe_tickets"]
+        return self._subscribe_list(user_id, "subscribe_tickets")
     
     def subscribe_events(self, user_id):
-        self.new_subscribe(user_id)
-        return self.data["users"][user_id]["subscribe"]["subscribe_events"]
+        return self._subscribe_list(user_id, "subscribe_events")
+    
+    def _is_subscribed(self, user_id, list_key, key):
+        user = self.data["users"].get(_to_str_id(user_id))
+        sub = user.get("subscribe") if user is not None else None
+        if not sub:
+            return False
+        return key in self._subscribe_index(sub, list_key)
     
     def is_ticket_subscribed(self, user_id, ticket_id):
-        return str(ticket_id) in self.subscribe_tickets(user_id)
+        return self._is_subscribed(user_id, "subscribe_tickets", str(ticket_id))
     
     def is_event_subscribed(self, user_id, event_id):
-        return str(event_id) in self.subscribe_events(user_id)
+        return self._is_subscribed(user_id, "subscribe_events", str(event_id))
     
     async def post_private_msg(self, bot: BasePlugin, user_id, text, condition=True):
         if not condition:
@@ -315,16 +658,18 @@ class UsersManager(BaseDataManager):
         except Exception as e:
             log.error(f"保存点赞状态失败（将继续执行点赞）：{e}")
 
-        # 逐个尝试点赞；对上限/自赞等业务错误静默跳过
-        for uid in friend_ids:
-            try:
-                r = await bot.api.send_like(uid, 10)
-                # 如果返回结构中包含业务失败，也仅记录
-                if isinstance(r, dict) and r.get("status") == "failed":
-                    log.warning(f"点赞 {uid} 失败：{r.get('message') or r}")
-            except Exception as e:
-                log.warning(f"点赞 {uid} 异常，已跳过：{e}")
-                continue
+        # 限制并发地批量点赞；对上限/自赞等业务错误静默跳过
+        sem = asyncio.Semaphore(API_CONCURRENCY)
+        async def _like(uid):
+            async with sem:
+                try:
+                    r = await bot.api.send_like(uid, 10)
+                    # 如果返回结构中包含业务失败，也仅记录
+                    if isinstance(r, dict) and r.get("status") == "failed":
+                        log.warning(f"点赞 {uid} 失败：{r.get('message') or r}")
+                except Exception as e:
+                    log.warning(f"点赞 {uid} 异常，已跳过：{e}")
+        await asyncio.gather(*(_like(uid) for uid in friend_ids))
         return True
 
     def is_like_enabled(self) -> bool:
@@ -342,19 +687,20 @@ class UsersManager(BaseDataManager):
     async def check_friend_status(self, bot: BasePlugin):
         result = await bot.api.get_friend_list(False)
         
-        friends = [str(i["user_id"]) for i in result["data"]]
-        for user_id in self.users_list():
-            if user_id not in friends:
+        friends = {str(i["user_id"]) for i in result["data"]}
+        # 只需处理不在好友列表中的用户；差集为新建的 set，遍历时删除用户是安全的
+        sem = asyncio.Semaphore(API_CONCURRENCY)
+        async def _remind(user_id):
+            async with sem:
                 r = await bot.api.post_private_msg(user_id, text="老师请添加bot为好友，防止消息被误吞~")
-                if r['retcode'] == 1200 and not r['data']:
-                        self.delete_user(user_id)
-            else:
-                self.add_user(user_id)
+            if r['retcode'] == 1200 and not r['data']:
+                self.delete_user(user_id)
+        await asyncio.gather(*(_remind(user_id) for user_id in self.data["users_list"] - friends))
     
     async def update_friends_list(self, bot: BasePlugin):
         await self.check_friend_status(bot)
         for user_id in self.users_list():
-            self.update_user_keys(str(user_id))
+            self.update_user_keys(user_id)
         return await self.send_likes(bot)
 
 
@@ -362,25 +708,23 @@ class UsersManager(BaseDataManager):
         """
         更新已关注场次的关注模式
         """
-        user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         ticket_id = str(ticket_id)
-        tickets = self.data["users"][user_id]["subscribe"].setdefault("subscribe_tickets", [])
-        for t in tickets:
-            if str(t['id']) == ticket_id:
-                t['mode'] = new_mode
-                break
+        ticket = self._find_subscribe_entry(self.data["users"][user_id]["subscribe"], "subscribe_tickets", ticket_id)
+        if ticket is not None:
+            ticket['mode'] = new_mode
+            self.mark_dirty(user_id)
 
     def update_event_subscribe_mode(self, user_id, event_id, new_mode):
         """
         更新已关注剧目的关注模式
         """
-        user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         event_id = str(event_id)
-        events = self.data["users"][user_id]["subscribe"].setdefault("subscribe_events", [])
-        for e in events:
-            if str(e['id']) == event_id:
-                e['mode'] = new_mode
-                break
+        event = self._find_subscribe_entry(self.data["users"][user_id]["subscribe"], "subscribe_events", event_id)
+        if event is not None:
+            event['mode'] = new_mode
+            self.mark_dirty(user_id)
     
     def migrate_event_subscriptions(self, from_event_id: str, to_event_id: str):
         """
@@ -392,13 +736,22 @@ class UsersManager(BaseDataManager):
         to_event_id = str(to_event_id)
         migrated_count = 0
         
-        for user_id in self.data.get("users_list", []):
-            events = self.data["users"][user_id]["subscribe"].get("subscribe_events", [])
-            for e in events:
-                if str(e['id']) == from_event_id:
-                    e['id'] = to_event_id
-                    migrated_count += 1
-                    break
+        for user_id, user in self.data.get("users", {}).items():
+            sub = user.get("subscribe")
+            if not sub:
+                continue
+            index = self._subscribe_index(sub, "subscribe_events")
+            pos = index.get(from_event_id)
+            if pos is None:
+                continue
+            if to_event_id in index:
+                # 已订阅新事件，直接去掉旧条目，避免出现重复订阅
+                self._remove_subscribe_entry(sub, "subscribe_events", from_event_id, user_id)
+            else:
+                sub["subscribe_events"][pos]['id'] = to_event_id
+                index[to_event_id] = index.pop(from_event_id)
+                self.mark_dirty(user_id)
+            migrated_count += 1
         
         return migrated_count
     
@@ -410,22 +763,23 @@ class UsersManager(BaseDataManager):
         include_events: 白名单，仅关注这些剧目的该演员（event_id列表）
         exclude_events: 黑名单，不关注这些剧目的该演员（event_id列表）
         """
-        user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         self.new_subscribe(user_id)
         if isinstance(actor_names, str):
             actor_names = [actor_names]
         
-        actors = self.data["users"][user_id]["subscribe"]["subscribe_actors"]
+        sub = self.data["users"][user_id]["subscribe"]
         for actor in actor_names:
             actor_entry = {
                 'actor': actor, 
+                'actor_key': _actor_key(actor),
                 'mode': mode,
             }
             if include_events:
                 actor_entry['include_events'] = [str(e) for e in include_events]
             if exclude_events:
                 actor_entry['exclude_events'] = [str(e) for e in exclude_events]
-            actors.append(actor_entry)
+            self._upsert_subscribe_entry(sub, "subscribe_actors", actor_entry, user_id)
         return True
     
     def remove_actor_subscribe(self, user_id, actor_name):
@@ -442,19 +796,15 @@ class UsersManager(BaseDataManager):
                 'tickets_removed': int  # 移除的场次数量
             }
         """
-        user_id = str(user_id)
-        actor_name_lower = str(actor_name).strip().lower()
+        user_id = _to_str_id(user_id)
+        actor_name_lower = _actor_key(actor_name)
         
+        sub = self.data["users"][user_id]["subscribe"]
         # 1. 移除演员订阅
-        actors = self.data["users"][user_id]["subscribe"].get("subscribe_actors", [])
-        before = len(actors)
-        self.data["users"][user_id]["subscribe"]["subscribe_actors"] = [
-            a for a in actors if a.get('actor', '').strip().lower() != actor_name_lower
-        ]
-        actor_removed = before != len(self.data["users"][user_id]["subscribe"]["subscribe_actors"])
+        actor_removed = self._remove_subscribe_entry(sub, "subscribe_actors", actor_name_lower, user_id)
         
         # 2. 清理关联场次
-        tickets = self.data["users"][user_id]["subscribe"].get("subscribe_tickets", [])
+        tickets = sub.get("subscribe_tickets", [])
         tickets_to_keep = []
         tickets_removed_count = 0
         
@@ -468,15 +818,20 @@ class UsersManager(BaseDataManager):
             
             # 如果有关联演员列表，移除当前演员
             if isinstance(related_actors, list):
-                # 过滤掉当前演员（不区分大小写）
-                updated_actors = [
-                    a for a in related_actors 
-                    if str(a).strip().lower() != actor_name_lower
-                ]
+                related_keys = ticket.get('related_actor_keys')
+                if related_keys is None or len(related_keys) != len(related_actors):
+                    related_keys = ticket['related_actor_keys'] = [_actor_key(a) for a in related_actors]
+                # 不关联当前演员，直接保留
+                if actor_name_lower not in related_keys:
+                    tickets_to_keep.append(ticket)
+                    continue
+                # 过滤掉当前演员（按写入时已标准化的键比较）
+                kept = [(a, k) for a, k in zip(related_actors, related_keys) if k != actor_name_lower]
                 
                 # 如果还有其他演员，更新列表并保留场次
-                if updated_actors:
-                    ticket['related_to_actors'] = updated_actors
+                if kept:
+                    ticket['related_to_actors'] = [a for a, _ in kept]
+                    ticket['related_actor_keys'] = [k for _, k in kept]
                     tickets_to_keep.append(ticket)
                 else:
                     # 列表为空，移除该场次
@@ -485,7 +840,9 @@ class UsersManager(BaseDataManager):
                 # 数据异常，保留场次
                 tickets_to_keep.append(ticket)
         
-        self.data["users"][user_id]["subscribe"]["subscribe_tickets"] = tickets_to_keep
+        sub["subscribe_tickets"] = tickets_to_keep
+        self._rebuild_subscribe_index(sub, "subscribe_tickets")
+        self.mark_dirty(user_id)
         
         return {
             'actor_removed': actor_removed,
@@ -497,8 +854,7 @@ class UsersManager(BaseDataManager):
         获取用户订阅的演员列表
         返回: [{actor: str, mode: int}, ...]
         """
-        self.new_subscribe(user_id)
-        return self.data["users"][user_id]["subscribe"]["subscribe_actors"]
+        return self._subscribe_list(user_id, "subscribe_actors")
     
     def add_actor_to_ticket_relation(self, user_id, ticket_id, actor_name):
         """
@@ -512,38 +868,40 @@ class UsersManager(BaseDataManager):
         Returns:
             bool: 是否成功添加关联
         """
-        user_id = str(user_id)
+        user_id = _to_str_id(user_id)
         ticket_id = str(ticket_id)
         actor_name = str(actor_name).strip()
         
-        tickets = self.data["users"][user_id]["subscribe"].get("subscribe_tickets", [])
+        ticket = self._find_subscribe_entry(self.data["users"][user_id]["subscribe"], "subscribe_tickets", ticket_id)
+        if ticket is None:
+            return False
+        related_actors = ticket.get('related_to_actors')
         
-        for ticket in tickets:
-            if str(ticket.get('id')) == ticket_id:
-                related_actors = ticket.get('related_to_actors')
-                
-                # 如果是None，创建新列表
-                if related_actors is None:
-                    ticket['related_to_actors'] = [actor_name]
-                # 如果是列表，添加演员（避免重复）
-                elif isinstance(related_actors, list):
-                    actor_lower = actor_name.lower()
-                    if not any(a.strip().lower() == actor_lower for a in related_actors):
-                        related_actors.append(actor_name)
-                
-                return True
+        # 如果是None，创建新列表
+        if related_actors is None:
+            ticket['related_to_actors'] = [actor_name]
+            ticket['related_actor_keys'] = [_actor_key(actor_name)]
+        # 如果是列表，添加演员（避免重复）
+        elif isinstance(related_actors, list):
+            actor_lower = _actor_key(actor_name)
+            related_keys = ticket.get('related_actor_keys')
+            if related_keys is None or len(related_keys) != len(related_actors):
+                related_keys = ticket['related_actor_keys'] = [_actor_key(a) for a in related_actors]
+            if actor_lower not in related_keys:
+                related_actors.append(actor_name)
+                related_keys.append(actor_lower)
         
-        return False
+        self.mark_dirty(user_id)
+        return True
     
     def update_actor_subscribe_mode(self, user_id, actor_name, new_mode):
         """
         更新演员订阅模式
         """
-        user_id = str(user_id)
-        actor_name = str(actor_name).strip().lower()
-        actors = self.data["users"][user_id]["subscribe"].get("subscribe_actors", [])
-        for a in actors:
-            if a.get('actor', '').strip().lower() == actor_name:
-                a['mode'] = new_mode
-                break
+        user_id = _to_str_id(user_id)
+        actor_name = _actor_key(actor_name)
+        actor = self._find_subscribe_entry(self.data["users"][user_id]["subscribe"], "subscribe_actors", actor_name)
+        if actor is not None:
+            actor['mode'] = new_mode
+            self.mark_dirty(user_id)
 
@@ -0,0 +1,19 @@
+import copy
+
+_ATOMIC_TYPES = (str, int, float, bool, type(None))
+
+
+def naive_deepcopy(obj):
+    """
+    针对 JSON 数据（dict/list/str/int/float/bool/None）的深拷贝，
+    跳过 copy.deepcopy 的 memo 字典与类型分派；其他类型回退到 copy.deepcopy。
+    注意：不处理循环引用，只用于从 JSON 加载的持久化数据。
+    """
+    t = type(obj)
+    if t is dict:
+        return {k: naive_deepcopy(v) for k, v in obj.items()}
+    if t is list:
+        return [naive_deepcopy(v) for v in obj]
+    if t in _ATOMIC_TYPES:
+        return obj
+    return copy.deepcopy(obj)
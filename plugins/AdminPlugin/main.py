@@ -1,14 +1,31 @@
 import os
 import html
+import asyncio
+import functools
+from itertools import islice
 
 from ncatbot.plugin import BasePlugin, CompatibleEnrollment, Event
 from ncatbot.core import GroupMessage, PrivateMessage, BaseMessage
-from plugins.AdminPlugin.UsersManager import UsersManager
+from plugins.AdminPlugin.UsersManager import UsersManager, API_CONCURRENCY
 from ncatbot.utils.logger import get_log
 
 bot = CompatibleEnrollment  # 兼容回调函数注册器
 log = get_log()
 
+# 群发时每批处理的用户数，批与批之间让出事件循环
+BROADCAST_BATCH_SIZE = 200
+
+_CATEGORY_UTILITY = {"category": "utility"}  # 各管理员命令共用，勿修改
+
+def _first_arg(raw_message):
+    """取命令后的第一个参数，只扫描到所需位置"""
+    return raw_message.partition(" ")[2].partition(" ")[0]
+
+@functools.lru_cache(maxsize=128)
+def _compile_cmd(src, mode):
+    """缓存 /exec、/debug 的编译结果，重复执行同一段代码时跳过解析"""
+    return compile(src, f"<{mode}>", mode)
+
 class AdminPlugin(BasePlugin):
     name = "AdminPlugin"  # 插件名称
     version = "0.0.1"  # 插件版本
@@ -16,6 +33,26 @@ class AdminPlugin(BasePlugin):
     info = "Users Administration"  # 插件描述
     dependencies = {}  # 插件依赖，格式: {"插件名": "版本要求"}
 
+    # 管理员命令：(命令名, 处理方法名)，前缀/用法/标签均由命令名生成
+    _ADMIN_CMDS = (
+        ("op", "_on_add_op"),
+        ("exec", "_on_execute"),
+        ("debug", "_on_debug"),
+        ("deop", "_on_de_op"),
+        ("群发", "_on_global_message"),
+    )
+    # /exec、/debug 的代码在工作线程中执行，帮助文本需说明其限制
+    _THREAD_CMD_HELP = (
+        "代码在工作线程中执行，线程内没有运行中的事件循环："
+        "不能直接调用 asyncio.create_task / get_running_loop，"
+        "协程请用 asyncio.run_coroutine_threadsafe(coro, loop).result() 提交到事件循环；"
+        "读写 Hlq.data、User.data 等共享数据也应通过 loop 提交，避免与事件循环中的任务竞争"
+    )
+    _ADMIN_CMD_DESCRIPTIONS = {
+        "exec": "执行 Python 语句。" + _THREAD_CMD_HELP,
+        "debug": "求值 Python 表达式并打印结果。" + _THREAD_CMD_HELP,
+    }
+
     async def on_load(self):
         # 插件加载时执行的操作
         print(f"{self.name} 插件已加载")
@@ -23,60 +60,17 @@ class AdminPlugin(BasePlugin):
         # 注册功能示例
         self.users_manager = UsersManager()
         
-        self.register_admin_func(
-            name="op",
-            handler=self._on_add_op,
-            prefix="/op",
-            description="op",
-            usage="/op",
-            examples=["/op xxxxx"],
-            tags=["op"],
-            metadata={"category": "utility"}
-        )
-        
-        self.register_admin_func(
-            name="exec",
-            handler=self._on_execute,
-            prefix="/exec",
-            description="exec",
-            usage="/exec",
-            examples=["/exec xxxxx"],
-            tags=["exec"],
-            metadata={"category": "utility"}
-        )
-        
-        self.register_admin_func(
-            name="debug",
-            handler=self._on_debug,
-            prefix="/debug",
-            description="debug",
-            usage="/debug",
-            examples=["/debug xxxxx"],
-            tags=["debug"],
-            metadata={"category": "utility"}
-        )
-        
-        self.register_admin_func(
-            name="deop",
-            handler=self._on_de_op,
-            prefix="/deop",
-            description="deop",
-            usage="/deop",
-            examples=["/deop xxxxx"],
-            tags=["deop"],
-            metadata={"category": "utility"}
-        )
-        
-        self.register_admin_func(
-            name="群发",
-            handler=self._on_global_message,
-            prefix="/群发",
-            description="群发",
-            usage="/群发",
-            examples=["/群发 xxxxx"],
-            tags=["群发"],
-            metadata={"category": "utility"}
-        )
+        for name, attr in self._ADMIN_CMDS:
+            self.register_admin_func(
+                name=name,
+                handler=getattr(self, attr),
+                prefix=f"/{name}",
+                description=self._ADMIN_CMD_DESCRIPTIONS.get(name, name),
+                usage=f"/{name}",
+                examples=[f"/{name} xxxxx"],
+                tags=[name],
+                metadata=_CATEGORY_UTILITY
+            )
 
         # 点赞功能开关：/like on|off|status
         self.register_admin_func(
@@ -102,55 +96,96 @@ class AdminPlugin(BasePlugin):
         await self._event_bus.publish_async(self.pass_managers_event)
         
     async def _on_global_message(self, msg:BaseMessage):
-        message = msg.split(" ")[1]
-        for i in self.users_manager.users():
-            await self.api.post_private_msg(i, message)
-        await msg.reply("群发成功")
+        message = msg.raw_message.partition(" ")[2]
+        if not message.strip():
+            await msg.reply("需输入群发内容")
+            return
+        # 分批并发发送：信号量限制同时在途的请求数，批次限制同时存在的任务数
+        sem = asyncio.Semaphore(API_CONCURRENCY)
+        total = failed = 0
+        async def _send(user_id):
+            nonlocal failed
+            async with sem:
+                try:
+                    await self.api.post_private_msg(user_id, message)
+                except Exception as e:
+                    # 在任务内部吞掉异常，避免 TaskGroup 因单个失败取消其余发送
+                    failed += 1
+                    log.error(f"群发给 {user_id} 失败：{e}")
+        users = self.users_manager.iter_users()
+        while batch := list(islice(users, BROADCAST_BATCH_SIZE)):
+            async with asyncio.TaskGroup() as tg:
+                for user_id in batch:
+                    tg.create_task(_send(user_id))
+            total += len(batch)
+            await asyncio.sleep(0)
+        if failed:
+            await msg.reply(f"群发完成：成功 {total - failed}，失败 {failed}")
+        else:
+            await msg.reply("群发成功")
+        
+    def _snippet_namespace(self, msg):
+        """
+        /exec、/debug 代码片段的独立命名空间，不暴露本模块的全局变量
+        传入事件循环，代码片段可用 asyncio.run_coroutine_threadsafe 把协程交回主循环执行
+        """
+        return {
+            "__builtins__": __builtins__,
+            "asyncio": asyncio,
+            "log": log,
+            "self": self,
+            "msg": msg,
+            "loop": asyncio.get_running_loop(),
+        }
         
     async def _on_execute(self, msg: BaseMessage):
-        cmd = msg.raw_message.replace("/exec ", "")
+        cmd = msg.raw_message.removeprefix("/exec ")
         cmd = html.unescape(cmd)  # 解码HTML实体
         try:
-            exec(cmd)
+            # 在线程中执行，耗时的代码片段不会阻塞事件循环
+            await asyncio.to_thread(exec, _compile_cmd(cmd, "exec"), self._snippet_namespace(msg))
             await msg.reply(f"命令执行了")
         except Exception as e:
             await msg.reply(f"命令执行失败：{str(e)}")
             
     async def _on_debug(self, msg: BaseMessage):
-        cmd = msg.raw_message.replace("/debug ", "")
+        cmd = msg.raw_message.removeprefix("/debug ")
         cmd = html.unescape(cmd)  # 解码HTML实体
         print(f"Debugging command: {cmd}")
         try:
-            print(eval(cmd))
+            print(await asyncio.to_thread(eval, _compile_cmd(cmd, "eval"), self._snippet_namespace(msg)))
         except Exception as e:
             print(f"命令执行失败：{str(e)}")
         
     async def _on_add_op(self, msg: BaseMessage):
-        command = msg.raw_message.split(" ")
-        if len(command) < 2:
+        user_id = _first_arg(msg.raw_message)
+        if not user_id:
             await msg.reply(f"需输入目标账号")
             return
-        user_id = command[1]
-        self.data["ops_list"].append(user_id)
-        if self.users_manager.add_op(user_id):
-            await msg.reply(f"已成功赋予用户{user_id}管理员权限。")
-        else:
+        # UsersManager 中的 ops_list 为 set，重复赋权在此 O(1) 拦截，不再重复追加到插件数据
+        if self.users_manager.is_op(user_id):
             await msg.reply(f"赋权失败！用户{user_id}已经拥有管理员权限。")
+            return
+        self.data.setdefault("ops_list", []).append(user_id)
+        self.users_manager.add_op(user_id)
+        await msg.reply(f"已成功赋予用户{user_id}管理员权限。")
     
         
         
         
     async def _on_de_op(self, msg: BaseMessage):
-        command = msg.raw_message.split(" ")
-        if len(command) < 2:
+        user_id = _first_arg(msg.raw_message)
+        if not user_id:
             await msg.reply(f"需输入目标账号")
             return
-        user_id = command[1]
-        
-        if self.users_manager.de_op(user_id):
-            await msg.reply(f"已成功撤销用户{user_id}的管理员权限。")
-        else:
+        if not self.users_manager.is_op(user_id):
             await msg.reply(f"撤销失败！用户{user_id}无管理员权限。")
+            return
+        self.users_manager.de_op(user_id)
+        ops_list = self.data.get("ops_list")
+        if ops_list and user_id in ops_list:
+            ops_list.remove(user_id)
+        await msg.reply(f"已成功撤销用户{user_id}的管理员权限。")
             
 
         
@@ -158,8 +193,7 @@ class AdminPlugin(BasePlugin):
             
     @bot.private_event()
     async def on_private_message(self, msg: PrivateMessage):
-        self.users_manager.add_user(msg.user_id)
-        self.users_manager.add_chats_count(msg.user_id)
+        self.users_manager.touch_user(msg.user_id)
 
     async def _on_like_toggle(self, msg: BaseMessage):
         # 仅管理员可用
@@ -1,20 +1,94 @@
 from datetime import datetime, timedelta
 from plugins.Hulaquan.utils import *
 from plugins.Hulaquan import BaseDataManager
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from .Exceptions import *
 import aiohttp
 import os, shutil
-import copy
 import json
 import asyncio
+import functools
+import random
 import re
+import time
 
 """
     更新思路：
     1.按照是否修改self将函数数据分类
     """
 
+_UTF8_BOM = b"\xef\xbb\xbf"
+
+def _loads_body(raw):
+    """直接从响应字节解析 json，去除 BOM，省去 text()/encode()/decode() 的多次拷贝"""
+    if raw[:3] == _UTF8_BOM:
+        raw = raw[3:]
+    return json_loads(raw)
+
+# 剧目、场次需要保存的字段
+_EVENT_KEYS = ("id", "title", "location", "start_time", "end_time", "update_time", "deadline", "create_time")
+_TICKET_KEYS = ("id", "event_id", "title", "start_time", "end_time", "status", "create_time", "ticket_price", "total_ticket", "left_ticket_count", "left_days", "valid_from")
+
+# 批量刷新场次时同时存在的任务上限（实际请求并发仍由 self.semaphore 控制）
+_UPDATE_WINDOW = 20
+# 批量检索卡司时同时进行的扫剧查询上限
+_CAST_CONCURRENCY = 10
+# 卡司查询缓存的最大条目数，超出后淘汰最久未使用的条目
+_CAST_CACHE_SIZE = 2048
+# 过期场次清理的最小间隔（秒）
+_CLEANUP_INTERVAL = 3600
+# 单个剧目详情请求的最大尝试次数
+_MAX_RETRIES = 5
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_title(title):
+    """剧名标准化（《剧名》小写），与虚拟事件的标准化方式一致；标题在各轮刷新间反复出现，结果缓存"""
+    return extract_text_in_brackets(title, True).strip().lower()
+
+def _cast_lower_set(cast_data):
+    """
+    卡司查询结果中演员名（去空白、小写）的集合，首次使用时计算并存回结果字典
+    结果字典在 _cast_cache 每轮更新清空后重新生成，集合随之失效
+    """
+    lower_set = cast_data.get("_cast_lower_set")
+    if lower_set is None:
+        lower_set = cast_data["_cast_lower_set"] = frozenset(
+            c['artist'].strip().lower() for c in cast_data.get('cast', []) if c.get('artist')
+        )
+    return lower_set
+
+@functools.lru_cache(maxsize=4096)
+def _parse_end_time(end_time):
+    """场次结束时间解析；同一场次的各票档共用同一结束时间字符串，结果缓存"""
+    return standardize_datetime(end_time, return_str=False)
+
+def _write_data_cache(cache_folder_name, update_time_str, old_bytes, new_bytes):
+    cache_root = os.path.join(os.getcwd(), cache_folder_name)
+    os.makedirs(cache_root, exist_ok=True)
+    # 清理超过48小时的缓存
+    now = datetime.now()
+    for d in os.listdir(cache_root):
+        dir_path = os.path.join(cache_root, d)
+        if os.path.isdir(dir_path):
+            try:
+                # 目录名格式为"2025-07-03_12-34-56"
+                dir_time = datetime.strptime(d, "%Y-%m-%d_%H-%M-%S")
+                if now - dir_time > timedelta(hours=48):
+                    shutil.rmtree(dir_path)
+            except Exception:
+                continue
+    # 新建本次缓存
+    cache_dir = os.path.join(cache_root, update_time_str)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, "old_data_all.json"), "wb") as f:
+        f.write(old_bytes)
+    with open(os.path.join(cache_dir, "new_data_all.json"), "wb") as f:
+        f.write(new_bytes)
+
+_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+}
+
 
 
 class HulaquanDataManager(BaseDataManager):
@@ -45,6 +119,12 @@ class HulaquanDataManager(BaseDataManager):
         Alias = dataManagers.Alias  # 动态获取
         User = dataManagers.User  # 动态获取
         self.semaphore = asyncio.Semaphore(10)  # 限制并发量10
+        self._session = None  # 共享的 aiohttp 会话，首次请求时创建
+        self._cast_cache = OrderedDict()  # 卡司查询缓存（LRU）{(剧名, 开演时间, 城市): Future[{"cast", "city"}]}，每轮更新时清空
+        self._tickets_by_date = None  # 按开演日期索引的场次 {date: [(eid, ticket, 开演时间)]}，场次数据变化时置空
+        self._ticket_index = None  # 由 ticket_details 反查的 {ticket_id: event_id}，场次数据变化时置空
+        self._cleanup_task = None  # 正在进行的过期场次清理任务，保留引用避免被回收
+        self._last_cleanup = 0.0  # 上次清理结束的时间（time.monotonic）
         self.data.setdefault("events", {})  # 确保有一个事件字典来存储数据
         self.data["pending_events"] = self.data.get("pending_events", {}) # 确保有一个pending_events来存储待办事件
         self.data["ticket_id_to_event_id"] = self.data.get("ticket_id_to_event_id", {})
@@ -53,18 +133,42 @@ class HulaquanDataManager(BaseDataManager):
     async def _update_events_dict_async(self):
         data = await self.search_all_events_async()
         data_dic = {"events": {}, "update_time": ""}
-        keys_to_extract = ["id", "title", "location", "start_time", "end_time", "update_time", "deadline", "create_time"]
+        old_events = self.data.get("events", {})
         for event in data:
             event_id = event['id'] = str(event['id'])
             Stats.register_event(event['title'], event_id)
             if event_id not in data_dic["events"]:
-                data_dic["events"][event_id] = {key: event.get(key, None) for key in keys_to_extract}
+                entry = {key: event.get(key) for key in _EVENT_KEYS}
+                old_entry = old_events.get(event_id)
+                if old_entry is not None:
+                    # 原地更新已有剧目，保留其 ticket_details，刷新场次前后不会出现空的剧目
+                    old_entry.update(entry)
+                    entry = old_entry
+                data_dic["events"][event_id] = entry
         data_dic["update_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.data["events"] = data_dic["events"]
+        self._invalidate_ticket_indexes()
         self.data["last_update_time"] = self.data.get("update_time", None)
         self.data["update_time"] = data_dic["update_time"]
         return data_dic
 
+    async def _get_session(self):
+        """
+        所有呼啦圈请求共用一个会话，复用 TCP/TLS 连接与 DNS 缓存
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=_HEADERS,
+                connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=600, keepalive_timeout=75),
+                timeout=aiohttp.ClientTimeout(total=20, connect=5),
+            )
+        return self._session
+    
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
     async def search_all_events_async(self):
         data = False
         cnt = 95
@@ -82,22 +186,17 @@ class HulaquanDataManager(BaseDataManager):
         recommendation_url = "https://clubz.cloudsation.com/site/getevent.html?filter=recommendation&access_token="
         try:
             recommendation_url = recommendation_url + "&limit=" + str(limit) + "&page=" + str(page)
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            }
-            async with aiohttp.ClientSession(headers=headers) as session:
-                async with session.get(recommendation_url, timeout=8) as response:
-                    json_data = await response.text()
-                    json_data = json_data.encode().decode("utf-8-sig")  # 关键：去除BOM
-                    json_data = json.loads(json_data)
-                    if isinstance(json_data, bool):
-                        return False, False
-                    result = []
-                    for event in json_data["events"]:
-                        if not timeMark or (timeMark and event["timeMark"] > 0):
-                            if not tags or (tags and any(tag in event["tags"] for tag in tags)):
-                                result.append(event["basic_info"])
-                    return json_data["count"], result
+            session = await self._get_session()
+            async with session.get(recommendation_url, timeout=aiohttp.ClientTimeout(total=8)) as response:
+                json_data = _loads_body(await response.read())
+                if isinstance(json_data, bool):
+                    return False, False
+                result = []
+                for event in json_data["events"]:
+                    if not timeMark or (timeMark and event["timeMark"] > 0):
+                        if not tags or (tags and any(tag in event["tags"] for tag in tags)):
+                            result.append(event["basic_info"])
+                return json_data["count"], result
         except Exception as e:
             return f"Error fetching recommendation: {e}", False
 
@@ -105,11 +204,30 @@ class HulaquanDataManager(BaseDataManager):
         if self.updating:
             return self.data
         self.updating = True
+        self._cast_cache.clear()
         try:
             await self._update_events_dict_async()
             event_ids = list(self.events().keys())
-            # 并发批量更新
-            await asyncio.gather(*(self._update_ticket_details_async(eid) for eid in event_ids))
+            # 并发批量更新：先取得窗口名额再创建任务，同时存在的任务数不超过窗口大小
+            window = asyncio.Semaphore(_UPDATE_WINDOW)
+            tasks = []
+            for eid in event_ids:
+                await window.acquire()
+                task = asyncio.create_task(self._build_ticket_details_async(eid))
+                task.add_done_callback(lambda _: window.release())
+                tasks.append(task)
+            results = await asyncio.gather(*tasks)
+            # 全部请求成功后再统一写回，任一剧目失败时 self.data 不会被写入一半
+            events = self.data["events"]
+            ticket_id_to_event_id = self.data['ticket_id_to_event_id']
+            for eid, built in zip(event_ids, results):
+                if built is None:
+                    continue
+                ticket_details, new_ticket_ids = built
+                events[eid]["ticket_details"] = ticket_details
+                for tid in new_ticket_ids:
+                    ticket_id_to_event_id.setdefault(tid, eid)
+            self._invalidate_ticket_indexes()
         except RequestTimeoutException:
             self.updating = False
             raise
@@ -117,59 +235,89 @@ class HulaquanDataManager(BaseDataManager):
             self.updating = False
             raise
         self.updating = False
+        # 每轮刷新后按间隔清理过期场次
+        self.update_ticket_dict_async()
         return self.data
 
-    async def _update_ticket_details_async(self, event_id, data_dict=None):
-        retry = 0
-        while retry < 3:
-            async with self.semaphore:
-                try:
-                    json_data = await self.search_event_by_id_async(event_id)
-                    keys_to_extract = ["id","event_id","title", "start_time", "end_time","status","create_time","ticket_price","total_ticket", "left_ticket_count", "left_days", "valid_from"]
-                    ticket_list = json_data["ticket_details"]
-                    ticket_dump_list = {}
-                    
-                    # 获取旧的 ticket_details 以保留 cast 和 city 数据
-                    old_tickets = self.data.get("events", {}).get(event_id, {}).get("ticket_details", {})
-                    
-                    for i in range(len(ticket_list)):
-                        ticket = ticket_list[i]
-                        tid = ticket['id'] = str(ticket.get("id", 0))
-                        if not tid or ticket.get("total_ticket", None) is None or not ticket.get('start_time') or ticket.get("status") not in ['active', 'pending']:
-                            if ticket.get("status") != "expired":
-                                print(ticket)
-                            continue
-                        ticket_dump_list[tid] = {key: ticket.get(key, None) for key in keys_to_extract}
-                        
-                        # 保留已有的 cast 和 city 数据
-                        if tid in old_tickets:
-                            if "cast" in old_tickets[tid]:
-                                ticket_dump_list[tid]["cast"] = old_tickets[tid]["cast"]
-                            if "city" in old_tickets[tid]:
-                                ticket_dump_list[tid]["city"] = old_tickets[tid]["city"]
-                        
-                        if tid not in self.data['ticket_id_to_event_id'].keys():
-                            self.data['ticket_id_to_event_id'][tid] = event_id
-                    if data_dict is None:
-                        self.data["events"][event_id]["ticket_details"] = ticket_dump_list
-                        return self.data
-                    else:
-                        data_dict["events"][event_id]["ticket_details"] = ticket_dump_list
-                        return data_dict
-                except asyncio.TimeoutError:
-                    retry += 1
-                    if retry >= 15:
-                        print(f"event_id {event_id} 请求超时，已重试2次，跳过")
-                        return {}
-                    else:
-                        print(f"event_id {event_id} 请求超时，重试第{retry}次……")
-                        await asyncio.sleep(1)
-                except Exception as e:
+    async def _fetch_event_with_retry(self, event_id):
+        """
+        请求剧目详情；超时、连接错误、429/5xx 按指数退避加随机抖动重试，其余错误直接抛出
+        重试耗尽返回 None
+        """
+        for attempt in range(_MAX_RETRIES):
+            try:
+                async with self.semaphore:
+                    return await self.search_event_by_id_async(event_id)
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientResponseError) as e:
+                if isinstance(e, aiohttp.ClientResponseError) and e.status != 429 and e.status < 500:
                     print(f"event_id {event_id} 请求异常：{e}")
                     raise
-                    return {}
+                if attempt + 1 >= _MAX_RETRIES:
+                    print(f"event_id {event_id} 请求失败，已重试{attempt}次，跳过")
+                    return None
+                # 退避期间不占用并发名额
+                delay = min(30, 2 ** attempt) * (1 + random.random() * 0.5)
+                print(f"event_id {event_id} 请求失败（{type(e).__name__}），{delay:.1f}秒后重试第{attempt + 1}次……")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                print(f"event_id {event_id} 请求异常：{e}")
+                raise
+
+    async def _build_ticket_details_async(self, event_id):
+        """
+        请求并整理单个剧目的场次，不修改 self.data
+        返回 (ticket_details, 尚未记录在 ticket_id_to_event_id 中的场次id列表)；请求失败被跳过时返回 None
+        """
+        json_data = await self._fetch_event_with_retry(event_id)
+        if json_data is None:
+            return None
+        try:
+            ticket_list = json_data["ticket_details"]
+            ticket_dump_list = {}
+            new_ticket_ids = []
+            
+            # 获取旧的 ticket_details 以保留 cast 和 city 数据
+            old_tickets = self.data.get("events", {}).get(event_id, {}).get("ticket_details", {})
+            ticket_id_to_event_id = self.data['ticket_id_to_event_id']
+            
+            for ticket in ticket_list:
+                tid = ticket['id'] = str(ticket.get("id", 0))
+                if not tid or ticket.get("total_ticket", None) is None or not ticket.get('start_time') or ticket.get("status") not in ['active', 'pending']:
+                    if ticket.get("status") != "expired":
+                        print(ticket)
+                    continue
+                ticket_dump_list[tid] = {key: ticket.get(key) for key in _TICKET_KEYS}
+                
+                # 保留已有的 cast 和 city 数据
+                if tid in old_tickets:
+                    if "cast" in old_tickets[tid]:
+                        ticket_dump_list[tid]["cast"] = old_tickets[tid]["cast"]
+                    if "city" in old_tickets[tid]:
+                        ticket_dump_list[tid]["city"] = old_tickets[tid]["city"]
+                
+                if tid not in ticket_id_to_event_id:
+                    new_ticket_ids.append(tid)
+            return ticket_dump_list, new_ticket_ids
+        except Exception as e:
+            print(f"event_id {event_id} 请求异常：{e}")
+            raise
+
+    async def _update_ticket_details_async(self, event_id, data_dict=None):
+        built = await self._build_ticket_details_async(event_id)
+        if built is None:
+            return {}
+        ticket_dump_list, new_ticket_ids = built
+        ticket_id_to_event_id = self.data['ticket_id_to_event_id']
+        for tid in new_ticket_ids:
+            ticket_id_to_event_id.setdefault(tid, event_id)
+        if data_dict is None:
+            self.data["events"][event_id]["ticket_details"] = ticket_dump_list
+            self._invalidate_ticket_indexes()
+            return self.data
+        else:
+            data_dict["events"][event_id]["ticket_details"] = ticket_dump_list
+            return data_dict
 
-    
     def events(self):
         return self.data["events"]
     
@@ -185,24 +333,20 @@ class HulaquanDataManager(BaseDataManager):
         if self.updating:
             # 当数据正在更新时，等到数据全部更新完再继续
             await self._wait_for_data_update()
-        data = self.events()
-        result = []
-        for eid, event in data.items():
-            title = event["title"]
-            if re.search(event_name, title, re.IGNORECASE):
-                result.append([eid, title])
-        return result
+        try:
+            pattern = re.compile(event_name, re.IGNORECASE)
+        except re.error:
+            # 用户输入不是合法正则时按普通文本匹配
+            pattern = re.compile(re.escape(event_name), re.IGNORECASE)
+        search = pattern.search
+        return [[eid, event["title"]] for eid, event in self.events().items() if search(event["title"])]
     
     async def search_event_by_id_async(self, event_id):
         event_url = f"https://clubz.cloudsation.com/event/getEventDetails.html?id={event_id}"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        }
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(event_url, timeout=15) as resp:
-                json_data = await resp.text()
-                json_data = json_data.encode().decode("utf-8-sig")  # 关键：去除BOM
-                return json.loads(json_data)
+        session = await self._get_session()
+        async with session.get(event_url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+            resp.raise_for_status()
+            return _loads_body(await resp.read())
         
     async def output_data_info(self):
         old_data = self.events()
@@ -213,21 +357,33 @@ class HulaquanDataManager(BaseDataManager):
 
 
     def get_max_ticket_content_length(self, tickets, ticket_title_key='title'):
-        max_len = 0
-        for ticket in tickets:
-            s = f"{ticket[ticket_title_key]} 余票{ticket['left_ticket_count']}/{ticket['total_ticket']}"
-            max_len = max(max_len, get_display_width(s))
-        return max_len
+        return max(
+            (get_display_width(f"{ticket[ticket_title_key]} 余票{ticket['left_ticket_count']}/{ticket['total_ticket']}")
+             for ticket in tickets),
+            default=0)
 
     # -------------------Query------------------------------ #         
     # ---------------------Announcement--------------------- #
+    def _snapshot_for_compare(self):
+        """
+        比较用的旧数据快照。更新流程只会替换 events、原地更新各剧目的基本字段、整体替换 ticket_details，
+        不会原地修改单个场次，因此复制到 ticket_details 这一层即可，无需深拷贝全部场次
+        """
+        snapshot = dict(self.data)
+        snapshot["events"] = {
+            eid: {**event, "ticket_details": dict(event.get("ticket_details", {}))}
+            for eid, event in self.data.get("events", {}).items()
+        }
+        snapshot["ticket_id_to_event_id"] = dict(self.data.get("ticket_id_to_event_id", {}))
+        return snapshot
+
     async def compare_to_database_async(self):
-        old_data_all = copy.deepcopy(self.data)
+        old_data_all = self._snapshot_for_compare()
         new_data_all = await self._update_events_data_async()
         try:
             return await self.__compare_to_database(old_data_all, new_data_all)
         except Exception as e:
-            self.save_data_cache(old_data_all, new_data_all, "error_announcement_cache")
+            await self.save_data_cache(old_data_all, new_data_all, "error_announcement_cache")
             raise  # 重新抛出异常，便于外层捕获和处理
 
     async def __compare_to_database(self, old_data_all, new_data_all):
@@ -258,7 +414,7 @@ class HulaquanDataManager(BaseDataManager):
         old_data = old_data_all.get("events", {})
         
         # 检测新增的事件，用于虚拟事件迁移和演员订阅匹配
-        new_event_ids = set(new_data.keys()) - set(old_data.keys())
+        new_event_ids = new_data.keys() - old_data
         if new_event_ids:
             # 虚拟事件迁移
             await self.__migrate_virtual_events(new_event_ids, new_data)
@@ -270,19 +426,19 @@ class HulaquanDataManager(BaseDataManager):
                 log.info(f"新排期演员匹配完成，为 {len(actor_match_counts)} 个用户补充了票务订阅")
         
         comp_data = {}
-        for eid in new_data.keys():
-            comp = self.compare_tickets(old_data.get(eid, {}), new_data[eid].get("ticket_details", None))
+        for eid, event in new_data.items():
+            comp = self.compare_tickets(old_data.get(eid, {}), event.get("ticket_details", None))
             if not comp:
                 continue
             comp_data[eid] = comp
             is_updated = True
-            if any(k in ["new", "add", "pending"] for k in comp.keys()):
+            if "new" in comp or "add" in comp or "pending" in comp:
                 save_cache = True
             # fix
         
         result = await self.__generate_compare_message_text(comp_data)
         if save_cache:
-            self.save_data_cache(old_data_all, new_data_all, "update_data_cache")
+            await self.save_data_cache(old_data_all, new_data_all, "update_data_cache")
         return result
     
     async def __migrate_virtual_events(self, new_event_ids, new_data):
@@ -297,23 +453,24 @@ class HulaquanDataManager(BaseDataManager):
         from ncatbot.utils.logger import get_log
         log = get_log()
         
+        # 标准化标题 -> 虚拟事件ID；同名时保留第一个，与逐个比较时的匹配结果一致
+        virtual_by_norm = {}
+        for virtual_id, virtual_normalized in virtual_events.items():
+            virtual_by_norm.setdefault(virtual_normalized, virtual_id)
+        
         for event_id in new_event_ids:
             event_info = new_data.get(event_id, {})
             event_title = event_info.get('title', '')
             if not event_title:
                 continue
             
-            # 标准化新事件标题
-            normalized_title = extract_text_in_brackets(event_title, True).strip().lower()
-            
             # 检查是否匹配任何虚拟事件
-            for virtual_id, virtual_normalized in virtual_events.items():
-                if normalized_title == virtual_normalized:
-                    # 执行迁移
-                    migrated_count = User.migrate_event_subscriptions(virtual_id, event_id)
-                    Stats.deactivate_virtual_event(virtual_id)
-                    log.info(f"虚拟事件迁移: {virtual_id} -> {event_id} ({event_title}), 迁移用户数: {migrated_count}")
-                    break
+            virtual_id = virtual_by_norm.get(_normalize_title(event_title))
+            if virtual_id is not None:
+                # 执行迁移
+                migrated_count = User.migrate_event_subscriptions(virtual_id, event_id)
+                Stats.deactivate_virtual_event(virtual_id)
+                log.info(f"虚拟事件迁移: {virtual_id} -> {event_id} ({event_title}), 迁移用户数: {migrated_count}")
 
     
     
@@ -389,7 +546,8 @@ class HulaquanDataManager(BaseDataManager):
                 for ticket in tickets:
                     # 仅返回更新了的ticket detail
                     ticket_id = str(ticket.get("id", ""))
-                    t = ("✨" if ticket['left_ticket_count'] > 0 else "❌") + f"{ticket['title']} 余票{ticket['left_ticket_count']}/{ticket['total_ticket']}" + " " + await self.get_cast_artists_str_async(event_title, ticket)
+                    cast_str = await self.get_cast_artists_str_async(event_title, ticket)
+                    t = f"{'✨' if ticket['left_ticket_count'] > 0 else '❌'}{ticket['title']} 余票{ticket['left_ticket_count']}/{ticket['total_ticket']} {cast_str}"
                     if stat == "pending":
                         valid_from = ticket.get("valid_from")
                         if not valid_from or valid_from == "null":
@@ -410,65 +568,36 @@ class HulaquanDataManager(BaseDataManager):
             self.pending_events_check_in(eid, pending_message, event_title) # 将即将开票的场次录入pending_dict
             url = f"https://clubz.cloudsation.com/event/{eid}.html"
             result["events_prefixes"][eid] = (
-                f"剧名: {event_title}\n" +
-                f"购票链接: {url}\n" +
-                f"更新时间: {self.data['update_time']}\n" +
-                (f"⏲️开票时间：{valid_from}" if valid_from else ""))
+                f"剧名: {event_title}\n"
+                f"购票链接: {url}\n"
+                f"更新时间: {self.data['update_time']}\n"
+                f"{f'⏲️开票时间：{valid_from}' if valid_from else ''}")
         return result
 
     def pending_events_check_in(self, eid, pending_message, title):
         if pending_message:
-            cnt = 1
+            pending_events = self.data["pending_events"]
+            # 与开票时间无关的前缀每个剧目只拼接一次
+            header = (f"剧名: {title}\n"
+                      f"购票链接: https://clubz.cloudsation.com/event/{eid}.html\n"
+                      f"更新时间: {self.data['update_time']}\n")
             for valid_from, m in pending_message.items():
-                cnt += 1
-                
                 valid_date = standardize_datetime(valid_from, return_str=True) if valid_from != "NG" else "NG"
-                if valid_date in self.data["pending_events"]:
-                    if eid in self.data["pending_events"][valid_date]:
-                        self.data["pending_events"][valid_date][eid] += '\n'.join(m)
-                    else:
-                        self.data["pending_events"][valid_date][eid] = (
-                            f"剧名: {title}\n"
-                                    f"购票链接: https://clubz.cloudsation.com/event/{eid}.html\n"
-                                    f"更新时间: {self.data['update_time']}\n"
-                                    f"开票时间: {valid_from}\n"
-                                    f"场次信息：\n" + '\n'.join(m) + "\n"
-                                    )
+                events_of_date = pending_events.setdefault(valid_date, {"valid_from": valid_date})
+                if eid in events_of_date:
+                    # 同一开票时间已有该剧目的记录，只追加场次信息
+                    events_of_date[eid] += "\n".join((*m, ""))
                 else:
-                    self.data["pending_events"][valid_date] = {
-                        "valid_from": valid_date,
-                        eid: (f"剧名: {title}\n"
-                                    f"购票链接: https://clubz.cloudsation.com/event/{eid}.html\n"
-                                    f"更新时间: {self.data['update_time']}\n"
-                                    f"开票时间: {valid_from}\n"
-                                    f"场次信息：\n" + '-'*10 + '\n'.join(m) + "\n"
-                                    )
-                                    
-                    }
+                    events_of_date[eid] = "\n".join((f"{header}开票时间: {valid_from}", "场次信息：", *m, ""))
 
-    def save_data_cache(self, old_data_all, new_data_all, cache_folder_name):
-        cache_root = os.path.join(os.getcwd(), cache_folder_name)
-        os.makedirs(cache_root, exist_ok=True)
-                # 清理超过48小时的缓存
-        now = datetime.now()
-        for d in os.listdir(cache_root):
-            dir_path = os.path.join(cache_root, d)
-            if os.path.isdir(dir_path):
-                try:
-                            # 目录名格式为"2025-07-03_12-34-56"
-                    dir_time = datetime.strptime(d, "%Y-%m-%d_%H-%M-%S")
-                    if now - dir_time > timedelta(hours=48):
-                        shutil.rmtree(dir_path)
-                except Exception:
-                    continue
-                # 新建本次缓存
+    async def save_data_cache(self, old_data_all, new_data_all, cache_folder_name):
+        """
+        在事件循环中序列化（数据可能随后被修改），目录清理与文件写入放到线程中执行
+        """
         update_time_str = str(self.data['update_time']).replace(":", "-").replace(" ", "_")
-        cache_dir = os.path.join(cache_root, update_time_str)
-        os.makedirs(cache_dir, exist_ok=True)
-        with open(os.path.join(cache_dir, "old_data_all.json"), "w", encoding="utf-8") as f:
-            json.dump(old_data_all, f, ensure_ascii=False, indent=2)
-        with open(os.path.join(cache_dir, "new_data_all.json"), "w", encoding="utf-8") as f:
-            json.dump(new_data_all, f, ensure_ascii=False, indent=2)
+        old_bytes = json_dumps_bytes(old_data_all)
+        new_bytes = json_dumps_bytes(new_data_all)
+        await asyncio.to_thread(_write_data_cache, cache_folder_name, update_time_str, old_bytes, new_bytes)
 
 
     def compare_tickets(self, old_data_all, new_data):
@@ -514,19 +643,19 @@ class HulaquanDataManager(BaseDataManager):
         
         update_data = []
         # 遍历 new_data 并根据条件进行更新
-        for new_id in list(new_data.keys()):
-            new_item = new_data[new_id]
+        # 按 new_data 原顺序遍历，保证推送消息中的场次顺序不变；旧数据用一次 get 取出
+        for new_id, new_item in new_data.items():
             new_left_ticket_count = new_item['left_ticket_count']
             new_total_ticket = new_item['total_ticket']
             if not new_item['title'] and not new_total_ticket:
                 continue
-            if new_id not in list(old_data_dict.keys()):
+            old_item = old_data_dict.get(new_id)
+            if old_item is None:
                 # 如果 new_data 中存在新的 ticket id，则标记为 新上架
                 new_item['update_status'] = 'new'
                 update_data.append(new_item)
             else:
                 # 如果 没有新的ticket id
-                old_item = old_data_dict[new_id]
                 old_left_ticket_count = old_item['left_ticket_count']
                 old_total_ticket = old_item['total_ticket']
                 # 新增change逻辑：余票变化且总票数不变
@@ -551,17 +680,54 @@ class HulaquanDataManager(BaseDataManager):
                     update_data.append(new_item)
                 else:
                     new_item['update_status'] = None
-        update = {}
+        update = defaultdict(list)
         for k in update_data:
-            stat = k['update_status']
-            update.setdefault(stat, [])
-            update[stat].append(k)
-        return update
+            update[k['update_status']].append(k)
+        return dict(update)
     
     
     async def get_ticket_cast_and_city_async(self, eName, ticket, city=None):
         if not ticket['start_time']:
             return {"cast":[], "city":None}
+        # 同一轮中同剧同场（不同票档）只查询一次扫剧；缓存 Future，并发的相同查询共用一次请求
+        key = (eName, ticket['start_time'], city)
+        cache = self._cast_cache
+        fut = cache.get(key)
+        is_owner = fut is None
+        if is_owner:
+            fut = asyncio.ensure_future(self._search_ticket_cast_and_city_async(eName, ticket, city))
+            cache[key] = fut
+            if len(cache) > _CAST_CACHE_SIZE:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        try:
+            # shield：某个调用方被取消时不影响共用同一请求的其他调用方
+            result = await asyncio.shield(fut)
+        except Exception:
+            # 失败的请求不缓存，下次重新查询
+            if cache.get(key) is fut:
+                del cache[key]
+            raise
+        if not is_owner and result["cast"]:
+            ticket["cast"] = result["cast"]
+            ticket['city'] = result["city"]
+        return result
+
+    async def _gather_ticket_casts_async(self, items):
+        """
+        并发检索多个场次的卡司，items 为 [(剧名, 场次dict)]，按传入顺序返回结果
+        同时进行的查询数不超过 _CAST_CONCURRENCY
+        """
+        limit = asyncio.Semaphore(_CAST_CONCURRENCY)
+
+        async def fetch(event_title, ticket_info):
+            async with limit:
+                return await self.get_ticket_cast_and_city_async(event_title, ticket_info)
+
+        return await asyncio.gather(*(fetch(event_title, ticket_info) for event_title, ticket_info in items))
+
+    async def _search_ticket_cast_and_city_async(self, eName, ticket, city=None):
         # 优先用别名系统检索名
         search_names = self.get_ordered_search_names(extract_text_in_brackets(eName, False), ticket['event_id'])
         for name in search_names:
@@ -584,74 +750,99 @@ class HulaquanDataManager(BaseDataManager):
         return (await self.get_ticket_cast_and_city_async(eName, ticket))["city"]
 
     # /date
+    def _invalidate_ticket_indexes(self):
+        """场次数据整体替换后调用，相关索引在下次使用时重建"""
+        self._tickets_by_date = None
+        self._ticket_index = None
+
+    def _get_ticket_index(self):
+        """
+        ticket_id → event_id 的反查索引，单次遍历所有剧目的 ticket_details 构建
+        ticket_details 只会被整体替换（随后置空索引）或删除场次（同步更新索引），不会原地新增场次，
+        因此索引未命中即可确定场次不存在，无需再逐个剧目扫描
+        """
+        if self._ticket_index is None:
+            events_map = self.data.get("events", {})
+            self._ticket_index = {
+                tid: eid
+                for eid, event in events_map.items()
+                for tid in event.get("ticket_details", {})
+            }
+        return self._ticket_index
+
+    def _get_tickets_by_date(self):
+        """
+        按开演日期索引场次，只收录开演日期落在所属剧目起止日期之内的场次
+        日期解析只在场次数据变化后的首次查询时进行一次，/date 查询直接按日期取出
+        """
+        if self._tickets_by_date is None:
+            index = defaultdict(list)
+            for eid, event in self.events().items():
+                try:
+                    event_start = standardize_datetime(event["start_time"], with_second=False, return_str=False).date()
+                    event_end = standardize_datetime(event["end_time"], with_second=False, return_str=False).date()
+                except Exception:
+                    continue
+                for ticket in event.get("ticket_details", {}).values():
+                    t_start = ticket.get("start_time")
+                    if not t_start:
+                        continue
+                    try:
+                        t_start = standardize_datetime(t_start, with_second=False, return_str=False)
+                    except Exception:
+                        continue
+                    if event_start <= t_start.date() <= event_end:
+                        index[t_start.date()].append((eid, ticket, t_start))
+            self._tickets_by_date = dict(index)
+        return self._tickets_by_date
+
     async def on_message_search_event_by_date(self, date, _city=None, ignore_sold_out=False):
         try:
             date_obj = standardize_datetime(date, with_second=False, return_str=False)
         except ValueError:
             return "日期格式错误，请使用 YYYY-MM-DD 格式。\n例如：/date 2025-07-19"
-        result_by_city = {}
-        city_events_count = {}
+        result_by_city = defaultdict(lambda: defaultdict(list))  # {城市: {开演时间: [场次]}}
         if self.updating:
             # 当数据正在更新时，等到数据全部更新完再继续
             await self._wait_for_data_update()
-        for eid, event in self.events().items():
-            try:
-                event_start = standardize_datetime(event["start_time"], with_second=False, return_str=False)
-                event_end = standardize_datetime(event["end_time"], with_second=False, return_str=False)
-            except Exception:
+        for eid, ticket, t_start in self._get_tickets_by_date().get(date_obj.date(), ()):
+            if ignore_sold_out and ticket.get("left_ticket_count", 0)==0:
                 continue
-            if not (event_start.date() <= date_obj.date() <= event_end.date()):
-                continue
-            for ticket in event.get("ticket_details", {}).values():
-                if ignore_sold_out and ticket.get("left_ticket_count", 0)==0:
-                    continue
-                t_start = ticket.get("start_time")
-                if not t_start:
-                    continue
-                try:
-                    t_start = standardize_datetime(t_start, with_second=False, return_str=False)
-                except Exception:
-                    continue
-                if t_start.date() != date_obj.date():
+            tInfo = extract_title_info(ticket.get("title", ""))
+            event_title = tInfo['title'][1:-1]
+            city = tInfo["city"]
+            event_city = city if city else (await self.get_ticket_city_async(event_title, ticket) or "未知城市")  # 传入的是部分标题
+            if _city:
+                if not event_city or _city not in event_city:
                     continue
-                tInfo = extract_title_info(ticket.get("title", ""))
-                event_title = tInfo['title'][1:-1]
-                city = tInfo["city"]
-                event_city = city if city else (await self.get_ticket_city_async(event_title, ticket) or "未知城市")  # 传入的是部分标题
-                if _city:
-                    if not event_city or _city not in event_city:
-                        continue
-                cast_str = await self.get_cast_artists_str_async(event_title, ticket, event_city) or "无卡司信息"
-                time_key = t_start.strftime("%H:%M")
-                if event_city not in result_by_city:
-                    result_by_city[event_city] = {}
-                    result_by_city[event_city][time_key] = []
-                    city_events_count[event_city] = 1
-                elif time_key not in result_by_city[event_city]:
-                    result_by_city[event_city][time_key] = []
-                city_events_count[event_city] += 1
-                result_by_city[event_city][time_key].append({
-                    "event_title": tInfo['title'] + " " + tInfo["price"] + (f"(原价：{tInfo['full_price']})" if tInfo["full_price"] else ""),
-                    "ticket_title": ticket.get("title", ""),
-                    "cast": cast_str,
-                    "left": ticket.get("left_ticket_count", "-"),
-                    "total": ticket.get("total_ticket", "-"),
-                })
+            cast_str = await self.get_cast_artists_str_async(event_title, ticket, event_city) or "无卡司信息"
+            result_by_city[event_city][t_start.strftime("%H:%M")].append({
+                "event_title": tInfo['title'] + " " + tInfo["price"] + (f"(原价：{tInfo['full_price']})" if tInfo["full_price"] else ""),
+                "ticket_title": ticket.get("title", ""),
+                "cast": cast_str,
+                "left": ticket.get("left_ticket_count", "-"),
+                "total": ticket.get("total_ticket", "-"),
+            })
         if not result_by_city:
             return f"{date} {_city or ''} 当天无呼啦圈学生票场次信息。"
-        message = f"{date} {_city or ''} 呼啦圈学生票场次：\n"
-        sorted_keys = sorted(city_events_count, key=lambda x: city_events_count[x], reverse=True)
+        lines = [f"{date} {_city or ''} 呼啦圈学生票场次："]
+        # 各城市场次数在分组完成后一次算出
+        city_events_count = {city_key: sum(map(len, by_time.values())) for city_key, by_time in result_by_city.items()}
+        sorted_keys = sorted(city_events_count, key=city_events_count.__getitem__, reverse=True)
         if "未知城市" in sorted_keys:
             sorted_keys.remove("未知城市")
             sorted_keys.append("未知城市")
         for city_key in sorted_keys:
-            message += f"城市：{city_key}\n"
-            for t in sorted(result_by_city[city_key].keys()):
-                message += f"⏲️时间：{t}\n"
-                for item in result_by_city[city_key][t]:
-                    message += ("✨" if item['left'] > 0 else "❌") + f"{item['event_title']} 余票{item['left']}/{item['total']}" + " " + item["cast"] + "\n"
-        message += f"\n数据更新时间: {self.data['update_time']}\n"
-        return message
+            lines.append(f"城市：{city_key}")
+            city_result = result_by_city[city_key]
+            for t in sorted(city_result):
+                lines.append(f"⏲️时间：{t}")
+                for item in city_result[t]:
+                    lines.append(f"{'✨' if item['left'] > 0 else '❌'}{item['event_title']} 余票{item['left']}/{item['total']} {item['cast']}")
+        lines.append("")
+        lines.append(f"数据更新时间: {self.data['update_time']}")
+        lines.append("")
+        return "\n".join(lines)
     
     
 
@@ -664,13 +855,12 @@ class HulaquanDataManager(BaseDataManager):
         if event_data:
             title = event_data.get("title", "未知剧名")
             tickets_details = event_data.get("ticket_details", {})
-            remaining_tickets = []
-            for ticket in tickets_details.values():
-                if ticket["status"] == "active":
-                    if ticket["left_ticket_count"] > (0 if ignore_sold_out else -1):
-                        remaining_tickets.append(ticket)
-                elif ticket["status"] == "pending":
-                    remaining_tickets.append(ticket)
+            threshold = 0 if ignore_sold_out else -1
+            remaining_tickets = [
+                ticket for ticket in tickets_details.values()
+                if (status := ticket["status"]) == "pending"
+                or (status == "active" and ticket["left_ticket_count"] > threshold)
+            ]
             url = f"https://clubz.cloudsation.com/event/{eid}.html"
             message = await self.build_ticket_query_info_message(
                 title, url, event_data, remaining_tickets, show_cast=show_cast, show_ticket_id=show_ticket_id
@@ -689,20 +879,21 @@ class HulaquanDataManager(BaseDataManager):
         pending = pending_t[0]
         valid_from = pending_t[1] if pending else ""
         # 拼接消息
-        message = ""
-        message += f"剧名: {title}\n"
-        message += f"购票链接：{url}\n"
-        message += f"最后更新时间：{update_time}\n"
+        parts = [
+            f"剧名: {title}\n",
+            f"购票链接：{url}\n",
+            f"最后更新时间：{update_time}\n",
+        ]
         if pending:
-            message += f"🕰️即将开票，开票时间：{valid_from}\n一切数据若有官方来源以官方为准，这个时间可能会因为主办方调整而改变。\n"
-        message += "剩余票务信息:\n"
-        message += ticket_info_message
+            parts.append(f"🕰️即将开票，开票时间：{valid_from}\n一切数据若有官方来源以官方为准，这个时间可能会因为主办方调整而改变。\n")
+        parts.append("剩余票务信息:\n")
+        parts.append(ticket_info_message)
         if no_saoju_data:
-            message += "\n⚠️未在扫剧网站上找到此剧卡司"
-        message += f"\n数据更新时间: {self.data['update_time']}\n"
-        return message
+            parts.append("\n⚠️未在扫剧网站上找到此剧卡司")
+        parts.append(f"\n数据更新时间: {self.data['update_time']}\n")
+        return "".join(parts)
 
-    async def build_single_ticket_info_str(self, ticket, show_cast, city="上海", show_ticket_id=False):
+    async def build_single_ticket_info_str(self, ticket, show_cast, city="上海", show_ticket_id=False, max_ticket_info_count=None):
         """
         根据ticket字典生成单条票务信息字符串。
         Args:
@@ -710,29 +901,35 @@ class HulaquanDataManager(BaseDataManager):
             show_cast: 是否显示卡司
             event_data: 事件数据（用于查城市）
             show_ticket_id: 是否显示票id
+            max_ticket_info_count: 票务信息对齐宽度，批量生成时由调用方统一计算；为 None 时按本场次计算
         Returns:
             (str, bool, tuple): ✨ 32808《连壁》09-11 19:30￥199（原价￥299) 学生票 余票2/2 韩冰儿 胥子含, ,()
         """
-        max_ticket_info_count = self.get_max_ticket_content_length([ticket])
-        if ticket['status'] == 'active' and ticket['left_ticket_count'] > 0:
-            ticket_status = "✨" 
-        elif ticket["status"] == 'pending':
-            v = ticket["valid_from"]
-            v = v if v else "未知时间"
-            ticket_status = f"🕰️"
-        else:
-            ticket_status = "❌"
-        ticket_details = ljust_for_chinese(f"{ticket['title']} 余票{ticket['left_ticket_count']}/{ticket['total_ticket']}", max_ticket_info_count)
-        if show_ticket_id:
-            ticket_details = ' ' + ticket['id'] + ticket_details
+        if max_ticket_info_count is None:
+            max_ticket_info_count = self.get_max_ticket_content_length([ticket])
+        text = self._format_ticket_line(ticket, max_ticket_info_count, show_ticket_id)
         no_saoju_data = False
         if show_cast:
             cast_str = await self.get_cast_artists_str_async(ticket['title'], ticket, city=city)
-            ticket_details += " " + cast_str
+            text += " " + cast_str
             if not cast_str:
                 no_saoju_data = True
-        text = ticket_status + ticket_details
-        return text, no_saoju_data, (ticket["status"] == 'pending', ticket["valid_from"])
+        return text, no_saoju_data, (ticket['status'] == 'pending', ticket["valid_from"])
+
+    def _format_ticket_line(self, ticket, max_ticket_info_count, show_ticket_id=False):
+        """生成不含卡司的单条票务信息：状态符号 + [票id] + 对齐后的标题与余票"""
+        status = ticket['status']
+        left = ticket['left_ticket_count']
+        if status == 'active' and left > 0:
+            ticket_status = "✨"
+        elif status == 'pending':
+            ticket_status = "🕰️"
+        else:
+            ticket_status = "❌"
+        ticket_details = ljust_for_chinese(f"{ticket['title']} 余票{left}/{ticket['total_ticket']}", max_ticket_info_count)
+        if show_ticket_id:
+            return f"{ticket_status} {ticket['id']}{ticket_details}"
+        return ticket_status + ticket_details
 
     async def _generate_ticket_info_message(self, remaining_tickets, show_cast, city, show_ticket_id):
         if not remaining_tickets:
@@ -740,8 +937,28 @@ class HulaquanDataManager(BaseDataManager):
         ticket_lines = []
         no_saoju_data = False
         pending_t = (False, "")
-        for ticket in remaining_tickets:
-            text, no_cast, pending_t = await self.build_single_ticket_info_str(ticket, show_cast, city, show_ticket_id)
+        # 对齐宽度对整条消息只计算一次
+        max_len = self.get_max_ticket_content_length(remaining_tickets)
+        if not show_cast:
+            # 不显示卡司时无需任何查询，直接同步生成全部行
+            last = remaining_tickets[-1]
+            return (
+                "\n".join(self._format_ticket_line(ticket, max_len, show_ticket_id) for ticket in remaining_tickets),
+                False,
+                (last['status'] == 'pending', last["valid_from"]),
+            )
+        # 各场次的卡司查询互不依赖，并发执行；gather 按传入顺序返回结果
+        results = await asyncio.gather(
+            *(self.build_single_ticket_info_str(ticket, show_cast, city, show_ticket_id, max_ticket_info_count=max_len)
+              for ticket in remaining_tickets),
+            return_exceptions=True,
+        )
+        for ticket, res in zip(remaining_tickets, results):
+            if isinstance(res, Exception):
+                print(f"场次 {ticket.get('id')} 信息生成失败：{res}")
+                ticket_lines.append(f"❌{ticket.get('title', '')} 场次信息获取失败")
+                continue
+            text, no_cast, pending_t = res
             if no_cast:
                 no_saoju_data = True
             ticket_lines.append(text)
@@ -749,6 +966,7 @@ class HulaquanDataManager(BaseDataManager):
     
     async def __update_ticket_dict_async(self):
         to_delete = []
+        now = datetime.now()
         for ticket_id, event_id in self.data['ticket_id_to_event_id'].items():
             ticket = self.ticket(ticket_id, event_id)
             if not ticket:
@@ -756,40 +974,62 @@ class HulaquanDataManager(BaseDataManager):
                 continue
             if "end_time" not in ticket:
                 continue
-            end_time = standardize_datetime(ticket["end_time"], return_str=False)
-            if datetime.now() > end_time:
+            if now > _parse_end_time(ticket["end_time"]):
                 to_delete.append((event_id, ticket_id))
-        for tup in to_delete:
-            eid, tid = tup
-            self.data['ticket_id_to_event_id'].pop(tid, None)
-            self.delete_ticket(tid, eid)
+        # 按剧目分组批量删除，每个剧目只解析一次 ticket_details
+        by_event = defaultdict(list)
+        for eid, tid in to_delete:
+            by_event[eid].append(tid)
+        events = self.data['events']
+        ticket_id_to_event_id = self.data['ticket_id_to_event_id']
+        ticket_index = self._ticket_index
+        for eid, tids in by_event.items():
+            event = events.get(eid)
+            ticket_details = event.get("ticket_details") if event is not None else None
+            for tid in tids:
+                ticket_id_to_event_id.pop(tid, None)
+                if ticket_index is not None:
+                    ticket_index.pop(tid, None)
+                if ticket_details:
+                    ticket_details.pop(tid, None)
             
     def update_ticket_dict_async(self):
-        asyncio.create_task(self.__update_ticket_dict_async())
+        """
+        调度一次过期场次清理：同一时间只保留一个清理任务，且两次清理至少间隔 _CLEANUP_INTERVAL 秒
+        """
+        if self._cleanup_task is not None and not self._cleanup_task.done():
+            return
+        if self._last_cleanup and time.monotonic() - self._last_cleanup < _CLEANUP_INTERVAL:
+            return
+        self._cleanup_task = asyncio.create_task(self._run_ticket_cleanup())
+
+    async def _run_ticket_cleanup(self):
+        try:
+            await self.__update_ticket_dict_async()
+        finally:
+            self._last_cleanup = time.monotonic()
     
     def ticket(self, ticket_id, event_id=None, default=None):
-        try:
+        if not event_id:
+            event_id = self.ticketID_to_eventID(ticket_id, raise_error=False)
             if not event_id:
-                event_id = self.ticketID_to_eventID(ticket_id, raise_error=False)
-                if not event_id:
-                    return default
-            if event_id not in self.events() or ticket_id not in self.ticket_details(event_id):
                 return default
-            return self.ticket_details(event_id)[ticket_id]
-        except (KeyError, Exception):
+        ev = self.data['events'].get(event_id)
+        if ev is None:
             return default
+        return ev.get("ticket_details", {}).get(ticket_id, default)
     
     def delete_ticket(self, ticket_id, event_id=None):
-        try:
+        if not event_id:
+            event_id = self.ticketID_to_eventID(ticket_id, raise_error=False)
             if not event_id:
-                event_id = self.ticketID_to_eventID(ticket_id, raise_error=False)
-                if not event_id:
-                    return None
-            if event_id not in self.events():
                 return None
-            return self.data['events'][event_id]["ticket_details"].pop(ticket_id, None)
-        except (KeyError, Exception):
+        ev = self.data['events'].get(event_id)
+        if ev is None:
             return None
+        if self._ticket_index is not None:
+            self._ticket_index.pop(ticket_id, None)
+        return ev.get("ticket_details", {}).pop(ticket_id, None)
     
     def ticket_details(self, event_id):
         """根据eventid获取票务数据
@@ -815,13 +1055,14 @@ class HulaquanDataManager(BaseDataManager):
         return self.data['events'][event_id]["ticket_details"]
     
     def ticketID_to_eventID(self, ticket_id, default=0, raise_error=True):
-        if ticket_id not in self.data["ticket_id_to_event_id"]:
-            for e in self.events():
-                for t in self.ticket_details(e).keys():
-                    if t == ticket_id:
-                        return e
-        else:
-            return self.data["ticket_id_to_event_id"][ticket_id]
+        event_id = self.data["ticket_id_to_event_id"].get(ticket_id)
+        if event_id is not None:
+            return event_id
+        event_id = self._get_ticket_index().get(ticket_id)
+        if event_id is not None:
+            # 反查命中时补回 ticket_id_to_event_id
+            self.data["ticket_id_to_event_id"][ticket_id] = event_id
+            return event_id
         if raise_error:
             raise KeyError
         return default
@@ -846,14 +1087,12 @@ class HulaquanDataManager(BaseDataManager):
                 
     
     def verify_ticket_id(self, ticket_id):
-        if isinstance(ticket_id, str):
-            ticket_id = [ticket_id]
-        denial = []
-        yes: list = ticket_id
-        for tid in ticket_id:
-            if not self.ticketID_to_eventID(tid, raise_error=False):
-                denial.append(tid)
-                yes.pop(tid, None)
+        ids = [ticket_id] if isinstance(ticket_id, str) else ticket_id
+        known = self.data["ticket_id_to_event_id"]
+        idx = self._get_ticket_index()
+        yes, denial = [], []
+        for tid in ids:
+            (yes if tid in known or tid in idx else denial).append(tid)
         return yes, denial
             
             
@@ -870,31 +1109,34 @@ class HulaquanDataManager(BaseDataManager):
         统一处理event_name转event_id逻辑。
         返回 (event_id, None) 或 (None, 错误消息)
         """
-        queue = ""
         eName = eName.strip().lower()
         search_names = self.get_ordered_search_names(title=eName)
+        # 检索只读内存数据，按优先级依次匹配，命中唯一结果即返回
+        ambiguous = None  # 最后一个匹配到多个剧目的检索结果
         for search_name in search_names:
             result = await self.search_eventID_by_name_async(search_name)
             if len(result) == 1:
-                eid = result[0][0]
                 Alias.set_no_response(eName, search_name, reset=True)
-                return eid, None
+                return result[0][0], None
             elif len(result) > 1:
-                if extra_id:
-                    if extra_id <= len(result):
-                        return result[extra_id-1][0], None
-                queue = [f"{i}. {event[1]}" for i, event in enumerate(result, start=1)]
+                if extra_id and extra_id <= len(result):
+                    return result[extra_id-1][0], None
+                ambiguous = result
             Alias.set_no_response(eName, search_name, reset=False)
-        return None, f"找到多个匹配的剧名，请重新以唯一的关键词查询，或使用\n/hlq {eName} -下面的序号\n查询对应的剧：\n" + "\n".join(queue) if queue else default
+        if not ambiguous:
+            return None, default
+        queue = "\n".join(f"{i}. {event[1]}" for i, event in enumerate(ambiguous, start=1))
+        return None, f"找到多个匹配的剧名，请重新以唯一的关键词查询，或使用\n/hlq {eName} -下面的序号\n查询对应的剧：\n{queue}"
 
 
     async def get_hlq_co_cast_event(self, co_casts, show_others=True):
         casts_data = await Saoju.request_co_casts_data(co_casts, show_others=show_others)
+        # 优先用别名系统查event_id，各剧名的检索互不依赖，一并发起
+        resolved = await asyncio.gather(
+            *(self.get_event_id_by_name(extract_text_in_brackets(event['title'], False)) for event in casts_data)
+        )
         message_id_list = []
-        for event in casts_data:
-            title = extract_text_in_brackets(event['title'], False)
-            # 优先用别名系统查event_id
-            event_id = await self.get_event_id_by_name(title)[0]
+        for event, (event_id, _) in zip(casts_data, resolved):
             if event_id:
                 event['event_id'] = event_id
                 message_id_list.append(event)
@@ -902,13 +1144,20 @@ class HulaquanDataManager(BaseDataManager):
             # 当数据正在更新时，等到数据全部更新完再继续
             await self._wait_for_data_update()
         tickets = []
+        by_start_cache = {}  # {event_id: {开演时间: ticket}}，同一剧目只建一次
         for event in message_id_list:
             # 获取对应的票务数据和卡司数据
             event_id = event['event_id']
-            for ticket_id, ticket in self.ticket_details(event_id).items():
-                if standardize_datetime_for_saoju(event["date"]) == ticket['start_time']:
-                    tickets.append(ticket)
-                    break
+            by_start = by_start_cache.get(event_id)
+            if by_start is None:
+                by_start = by_start_cache[event_id] = {}
+                for ticket in self.ticket_details(event_id).values():
+                    # 同一开演时间保留第一个票档，与逐个查找取首个匹配一致
+                    by_start.setdefault(ticket['start_time'], ticket)
+            ticket = by_start.get(standardize_datetime_for_saoju(event["date"]))
+            if ticket is not None:
+                tickets.append(ticket)
+        return tickets
     
     
     def get_ordered_search_names(self, title=None, event_id=None):
@@ -920,10 +1169,11 @@ class HulaquanDataManager(BaseDataManager):
         3. 若title本身为search_name，直接返回[title]。
         4. 否则返回空列表。
         """
+        e2n = Alias.data.get("event_to_names") or {}
         # 优先用event_id
         if event_id:
             event_id = str(event_id)
-            search_names = Alias.data.get("event_to_names", {}).get(event_id)
+            search_names = e2n.get(event_id)
             if search_names:
                 return list(search_names)
         # 其次用title查alias
@@ -932,13 +1182,13 @@ class HulaquanDataManager(BaseDataManager):
             # 1. 作为alias查event_id
             eid = Alias.get_event_id_by_alias(t)
             if eid:
-                search_names = Alias.data.get("event_to_names", {}).get(eid)
+                search_names = e2n.get(eid)
                 if search_names:
                     return list(search_names)
             # 2. 作为search_name查event_id
             eid2 = Alias.get_event_id_by_name(t)
             if eid2:
-                search_names = Alias.data.get("event_to_names", {}).get(eid2)
+                search_names = e2n.get(eid2)
                 if search_names:
                     return list(search_names)
             # 3. title本身为search_name
@@ -960,30 +1210,28 @@ class HulaquanDataManager(BaseDataManager):
         actor_lower = actor_name.strip().lower()
         matched_tickets = {}
         
-        # 确定需要搜索的事件范围
-        events_to_search = self.data.get("events", {})
-        if include_eids:
-            include_eids_str = [str(e) for e in include_eids]
-            events_to_search = {eid: event for eid, event in events_to_search.items() if eid in include_eids_str}
-        elif exclude_eids:
-            exclude_eids_str = [str(e) for e in exclude_eids]
-            events_to_search = {eid: event for eid, event in events_to_search.items() if eid not in exclude_eids_str}
+        # 确定需要搜索的事件范围：白名单优先，给出白名单时忽略黑名单
+        include_set = {str(e) for e in include_eids} if include_eids else None
+        exclude_set = {str(e) for e in exclude_eids} if exclude_eids and not include_eids else ()
         
-        # 遍历所有事件的所有场次
-        for event_id, event_data in events_to_search.items():
+        # 单次遍历筛选事件并收集范围内所有场次，并发获取卡司信息
+        items = []  # [(event_id, ticket_id, event_title, ticket_info)]
+        for event_id, event_data in self.data.get("events", {}).items():
+            if include_set is not None and event_id not in include_set:
+                continue
+            if event_id in exclude_set:
+                continue
             event_title = event_data.get('title', '')
-            tickets = event_data.get('ticket_details', {})
-            
-            for ticket_id, ticket_info in tickets.items():
-                # 获取该场次的卡司信息
-                cast_data = await self.get_ticket_cast_and_city_async(event_title, ticket_info)
-                cast_list = cast_data.get('cast', [])
-                
-                # 检查演员是否在卡司中
-                for cast_member in cast_list:
-                    if cast_member.get('artist', '').strip().lower() == actor_lower:
-                        matched_tickets[str(ticket_id)] = str(event_id)
-                        break
+            for ticket_id, ticket_info in event_data.get('ticket_details', {}).items():
+                items.append((event_id, ticket_id, event_title, ticket_info))
+        results = await self._gather_ticket_casts_async(
+            (event_title, ticket_info) for _, _, event_title, ticket_info in items
+        )
+        
+        # 检查演员是否在卡司中
+        for (event_id, ticket_id, _, _), cast_data in zip(items, results):
+            if actor_lower in _cast_lower_set(cast_data):
+                matched_tickets[str(ticket_id)] = str(event_id)
         
         return matched_tickets
     
@@ -1009,44 +1257,51 @@ class HulaquanDataManager(BaseDataManager):
         if not all_users_actors:
             return {}
         
-        # 为每个新事件检索卡司并匹配
-        user_new_tickets = {}  # {user_id: [(ticket_id, mode, actor_name)]}
+        # 演员订阅的筛选条件只需标准化一次：[(user_id, [(演员名, 小写演员名, 模式, include集合, exclude集合)])]
+        normalized_subs = []
+        for user_id, actors in all_users_actors.items():
+            subs = []
+            for actor_sub in actors:
+                actor_name = actor_sub.get('actor', '').strip()
+                subs.append((
+                    actor_name,
+                    actor_name.lower(),
+                    actor_sub.get('mode', 1),
+                    {str(e) for e in actor_sub.get('include_events', [])},
+                    {str(e) for e in actor_sub.get('exclude_events', [])},
+                ))
+            normalized_subs.append((user_id, subs))
         
+        # 收集新事件的所有场次，并发检索卡司
+        fetch_keys = []  # [(event_id, ticket_id, event_title, ticket_info)]
         for event_id in new_event_ids:
             event_data = self.data.get("events", {}).get(event_id)
             if not event_data:
                 continue
-            
             event_title = event_data.get('title', '')
-            tickets = event_data.get('ticket_details', {})
+            for ticket_id, ticket_info in event_data.get('ticket_details', {}).items():
+                fetch_keys.append((event_id, ticket_id, event_title, ticket_info))
+        casts = await self._gather_ticket_casts_async(
+            (event_title, ticket_info) for _, _, event_title, ticket_info in fetch_keys
+        )
+        
+        # 卡司全部就绪后在内存中匹配
+        user_new_tickets = {}  # {user_id: [(ticket_id, mode, actor_name)]}
+        for (event_id, ticket_id, _, _), cast_data in zip(fetch_keys, casts):
+            cast_actors_lower = _cast_lower_set(cast_data)
+            if not cast_actors_lower:
+                continue
             
-            # 为该事件的每个场次获取卡司
-            for ticket_id, ticket_info in tickets.items():
-                cast_data = await self.get_ticket_cast_and_city_async(event_title, ticket_info)
-                cast_list = cast_data.get('cast', [])
-                cast_actors_lower = [c.get('artist', '').strip().lower() for c in cast_list]
-                
-                # 匹配所有用户的演员订阅
-                for user_id, actors in all_users_actors.items():
-                    for actor_sub in actors:
-                        actor_name = actor_sub.get('actor', '').strip()
-                        actor_name_lower = actor_name.lower()
-                        mode = actor_sub.get('mode', 1)
-                        include_events = actor_sub.get('include_events', [])
-                        exclude_events = actor_sub.get('exclude_events', [])
-                        
-                        # 检查剧目筛选
-                        if include_events and event_id not in [str(e) for e in include_events]:
-                            continue
-                        if exclude_events and event_id in [str(e) for e in exclude_events]:
-                            continue
-                        
-                        # 检查演员是否在卡司中
-                        if actor_name_lower in cast_actors_lower:
-                            user_new_tickets.setdefault(user_id, [])
-                            # 同时记录场次ID、模式和演员名
-                            user_new_tickets[user_id].append((str(ticket_id), mode, actor_name))
-                            break  # 一个场次只为该用户添加一次
+            # 匹配所有用户的演员订阅
+            for user_id, subs in normalized_subs:
+                for actor_name, actor_name_lower, mode, include_events, exclude_events in subs:
+                    # 先检查演员是否在卡司中（绝大多数订阅在此被排除），再检查剧目筛选
+                    if (actor_name_lower in cast_actors_lower
+                            and event_id not in exclude_events
+                            and (not include_events or event_id in include_events)):
+                        # 同时记录场次ID、模式和演员名
+                        user_new_tickets.setdefault(user_id, []).append((str(ticket_id), mode, actor_name))
+                        break  # 一个场次只为该用户添加一次
         
         # 为用户批量添加票务订阅
         user_counts = {}
@@ -5,7 +5,9 @@ if __name__ == '__main__':
     sys.path.append("f:/MusicalBot")
     
 
-import aiohttp, asyncio, json
+import aiohttp, asyncio, json, functools, heapq, time, os, pickle
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 import pandas as pd
 from datetime import datetime, timedelta
 from plugins.Hulaquan import BaseDataManager
@@ -13,6 +15,10 @@ from plugins.Hulaquan.utils import *
 import requests
 from bs4 import BeautifulSoup
 
+# 排期中的日期/时间字符串在各次查询间反复出现，解析结果缓存（datetime 不可变，可安全共享）
+_parse_dt_cached = functools.lru_cache(maxsize=8192)(parse_datetime)
+_date_str_cached = functools.lru_cache(maxsize=4096)(dateToStr)
+
 class SaojuDataManager(BaseDataManager):
     """
     功能：
@@ -28,19 +34,102 @@ class SaojuDataManager(BaseDataManager):
         self.data.setdefault("date_dict", {})  # 确保有一个日期字典来存储数据
         self.data.setdefault("update_time_dict", {})  # 确保有一个更新时间字典来存储数据
         self.data["update_time_dict"].setdefault("date_dict", {})  # 确保有一个更新时间字典来存储数据
+        self._session = None  # 共享的 aiohttp 会话，首次请求时创建
+        self._request_limit = asyncio.Semaphore(8)  # 同时发往扫剧的请求上限，批量并发查询时避免压垮接口
+        self._inflight = {}  # {日期: asyncio.Future}，同一日期正在进行的请求，并发调用共享同一结果
+        self._daily_time_index = {}  # {日期: (当日场次列表, {开演时间: [场次]})}，当日数据被替换后按列表身份失效重建
+        self._daily_cast_index = {}  # {日期: (当日场次列表, {演员: [场次]})}，失效方式同上
+        # 演员名→pk 映射体量大且只在刷新时变化，单独存为 pickle，不随主 JSON 每次重写
+        self._artists_map_path = os.path.splitext(self.file_path)[0] + ".artists.pkl"
+        if "artists_map" not in self.data:
+            artists_map = self._load_artists_map()
+            if artists_map is not None:
+                self.data["artists_map"] = artists_map
+        elif not os.path.exists(self._artists_map_path):
+            # 旧版数据文件中的映射迁移到 pickle，下次保存时从 JSON 中移除
+            self._save_artists_map(self.data["artists_map"])
+        # 按过期时间排列的小顶堆 [(过期时间戳, 日期)]，加载时一次 heapify，之后每次只弹出已过期的条目
+        # _expiry_at 记录各日期当前有效的过期时间，重新安排过期时间后堆中的旧条目弹出时直接跳过
+        self._expiry_at = {date: self._expiry_ts(date) for date in self.data["update_time_dict"]["date_dict"]}
+        self._expiry_heap = [(ts, date) for date, ts in self._expiry_at.items()]
+        heapq.heapify(self._expiry_heap)
+        # 各日期上次拉取时间的时间戳，加载时解析一次，命中缓存时只做浮点比较；磁盘上仍保存字符串
+        self._fetched_at = {
+            date: parse_datetime(update_time).timestamp()
+            for date, update_time in self.data["update_time_dict"]["date_dict"].items()
+        }
         self.refresh_expired_data()
 
+    def _load_artists_map(self):
+        try:
+            with open(self._artists_map_path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"SAOJU ERROR: 读取演员映射缓存失败: {e}")
+            return None
+
+    def _save_artists_map(self, artists_map):
+        tmp_path = self._artists_map_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(artists_map, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._artists_map_path)
+
+    def _serialize(self, data):
+        # artists_map 已单独持久化，主 JSON 中不再重复写入
+        if "artists_map" not in data:
+            return data
+        return {k: v for k, v in data.items() if k != "artists_map"}
+
+    async def _refresh_artists_map(self):
+        artists_map = self.data['artists_map'] = await self.fetch_saoju_artist_list()
+        try:
+            await asyncio.to_thread(self._save_artists_map, artists_map)
+        except Exception as e:
+            print(f"SAOJU ERROR: 保存演员映射缓存失败: {e}")
+        return artists_map
+
+    def _schedule_expiry(self, date, ts):
+        if self._expiry_at.get(date) == ts:
+            return
+        self._expiry_at[date] = ts
+        heapq.heappush(self._expiry_heap, (ts, date))
+
+    @staticmethod
+    def _expiry_ts(date):
+        # 某天的排期在当天结束后过期
+        return (_parse_dt_cached(date) + timedelta(days=1)).timestamp()
+
+    async def _get_session(self):
+        """
+        所有扫剧请求共用一个会话，复用 TCP 连接与 DNS 缓存
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        return self._session
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
     async def search_day_async(self, date):
         url = "http://y.saoju.net/yyj/api/search_day/"
         data = {"date": date}
         max_retries = 5
         for attempt in range(max_retries):
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, params=data, timeout=10) as response:
+                session = await self._get_session()
+                async with self._request_limit:
+                    async with session.get(url, params=data, timeout=aiohttp.ClientTimeout(total=10)) as response:
                         response.raise_for_status()
-                        json_response = await response.json()
-                        return json_response
+                        raw = await response.read()
+                # 解析放到线程中进行，不阻塞事件循环，也不占用请求并发名额
+                return await asyncio.to_thread(json_loads, raw)
             except aiohttp.ClientError as http_err:
                 print(f'SAOJU ERROR HTTP error occurred (attempt {attempt+1}): {http_err}')
             except Exception as err:
@@ -50,15 +139,39 @@ class SaojuDataManager(BaseDataManager):
         return
 
     async def get_data_by_date_async(self, date, update_delta_max_hours=1):
-        if date in list(self.data["date_dict"].keys()):
-            update_time = parse_datetime(self.data["update_time_dict"]["date_dict"].get(date, None))
-            if update_time:
-                if (datetime.now() - update_time) < timedelta(hours=update_delta_max_hours):
-                    return self.data["date_dict"][date]
+        self.refresh_expired_data()
+        fetched_at = self._fetched_at.get(date)
+        if fetched_at is not None and date in self.data["date_dict"]:
+            if time.time() - fetched_at < update_delta_max_hours * 3600:
+                return self.data["date_dict"][date]
+        # 同一日期已有请求在途时直接等待其结果，避免并发查询重复请求扫剧
+        fut = self._inflight.get(date)
+        if fut is not None:
+            return await asyncio.shield(fut)
+        fut = self._inflight[date] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._fetch_date_async(date, update_delta_max_hours)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # 无人等待时不报 "exception was never retrieved"
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            del self._inflight[date]
+
+    async def _fetch_date_async(self, date, update_delta_max_hours=1):
         data = await self.search_day_async(date)
         if data:
+            # 已过去的日期也至少保留一个有效期窗口，避免下一次查询就被清除而反复请求
+            self._schedule_expiry(date, max(self._expiry_ts(date), time.time() + update_delta_max_hours * 3600))
             self.data["date_dict"][date] = data["show_list"]
             self.data["update_time_dict"]["date_dict"][date] = dateTimeToStr(datetime.now())
+            self._fetched_at[date] = time.time()
             return data["show_list"]
         else:
             return None
@@ -66,45 +179,77 @@ class SaojuDataManager(BaseDataManager):
 
     async def search_for_musical_by_date_async(self, search_name, date_time, city=None):
         # date_time: %Y-%m-%d %H:%M
-        date_time = parse_datetime(date_time)
-        _date = dateToStr(date_time)
+        date_time = _parse_dt_cached(date_time)
+        _date = _date_str_cached(date_time)
         _time = timeToStr(date_time)
         data = await self.get_data_by_date_async(_date)
         if not data:
             return None
-        for i in range(len(data)):
-            musical = data[i]["musical"]
-            if ((city in data[i]["city"]) if city else True) and _time == data[i]["time"] and ((search_name in musical) if isinstance(search_name, str) else all(i in musical for i in search_name) if isinstance(search_name, list) else False):
-                return data[i]
+        if isinstance(search_name, str):
+            names = (search_name,)
+        elif isinstance(search_name, list):
+            names = tuple(search_name)
+        else:
+            return None
+        # 先按开演时间取出当天同一时刻的少量场次，再检查城市和剧名
+        for show in self._shows_at_time(_date, data, _time):
+            if city and city not in show["city"]:
+                continue
+            musical = show["musical"]
+            if all(name in musical for name in names):
+                return show
         return None
 
+    def _shows_at_time(self, date, data, time_str):
+        cached = self._daily_time_index.get(date)
+        if cached is None or cached[0] is not data:
+            by_time = defaultdict(list)
+            for show in data:
+                by_time[show["time"]].append(show)
+            cached = self._daily_time_index[date] = (data, by_time)
+        return cached[1].get(time_str, ())
+
     def refresh_expired_data(self):
-        current_date = datetime.now()
-        for date in list(self.data["update_time_dict"]["date_dict"].keys()):
-            date_obj = parse_datetime(date)
-            if date_obj < current_date:
-                del self.data["date_dict"][date]
-                del self.data["update_time_dict"]["date_dict"][date]
+        now = time.time()
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            ts, date = heapq.heappop(heap)
+            if self._expiry_at.get(date) != ts:
+                continue  # 该日期已重新安排过期时间，这是旧条目
+            del self._expiry_at[date]
+            self.data["date_dict"].pop(date, None)
+            self.data["update_time_dict"]["date_dict"].pop(date, None)
+            self._fetched_at.pop(date, None)
+            self._daily_time_index.pop(date, None)
+            self._daily_cast_index.pop(date, None)
 
     async def search_for_artist_async(self, search_name, date):
-        date = dateToStr(date)
+        date = _date_str_cached(date)
         data = await self.get_data_by_date_async(date)
-        schedule = []
         if not data:
-            return schedule
-        for i in range(len(data)):
-            for cast in data[i]["cast"]:
-                if cast["artist"] == search_name:
-                    schedule.append(data[i])
-        return schedule
+            return []
+        return list(self._shows_of_artist(date, data, search_name))
+
+    def _shows_of_artist(self, date, data, artist):
+        cached = self._daily_cast_index.get(date)
+        if cached is None or cached[0] is not data:
+            by_artist = defaultdict(list)
+            for show in data:
+                for cast in show["cast"]:
+                    shows = by_artist[cast["artist"]]
+                    if not shows or shows[-1] is not show:
+                        shows.append(show)
+            cached = self._daily_cast_index[date] = (data, by_artist)
+        return cached[1].get(artist, ())
 
     async def search_artist_from_timetable_async(self, search_name, timetable: list):
+        # 各日期的查询互不依赖，一并发起；实际请求并发由 self._request_limit 控制
+        per_date = await asyncio.gather(*(self.search_for_artist_async(search_name, date) for date in timetable))
         schedule = []
-        for date in timetable:
-            show = await self.search_for_artist_async(search_name, date)
+        for date, show in zip(timetable, per_date):
+            date_str = _date_str_cached(date)
             for i in show:
-                show_date = dateToStr(date=date) + " " + i["time"]
-                show_date = parse_datetime(show_date)
+                show_date = _parse_dt_cached(date_str + " " + i["time"])
                 schedule.append((show_date, i))
         schedule.sort(key=lambda x: x[0])
         return schedule
@@ -112,49 +257,19 @@ class SaojuDataManager(BaseDataManager):
     async def check_artist_schedule_async(self, start_time, end_time, artist):
         timetable = delta_time_list(start_time, end_time)
         schedule = await self.search_artist_from_timetable_async(artist, timetable)
-        data = []
-        for event in schedule:
-            date = event[0]
-            info = event[1]
-            data.append({
-                '日期': date.strftime('%Y-%m-%d %H:%M'),
-                '剧名': info['musical'],
-                '时间': info['time'],
-                '剧场': info['theatre'],
-                '城市': info['city'],
-                '卡司': " ".join([i["artist"] for i in info['cast']])
-            })
-        df = pd.DataFrame(data)
-        s = "演员: {}".format(artist) + "\n" \
-            + ("从{}到{}的排期".format(start_time, end_time)) \
-            + "\n"
         schedule.sort(key=lambda x: x[0])
         return schedule
         
-    def check_artist_schedule(self, start_time, end_time, artist):
+    async def check_artist_schedule_str_async(self, start_time, end_time, artist):
         #start_time = "2025-05-19"
         #end_time = "2025-06-30"
         #artist = "丁辰西"
-        timetable = delta_time_list(start_time, end_time)
-        schedule = self.search_artist_from_timetable(artist, timetable)
-        data = []
-        for event in schedule:
-            date = event[0]
-            info = event[1]
-            data.append({
-                '日期': date.strftime('%Y-%m-%d %H:%M'),
-                '剧名': info['musical'],
-                '时间': info['time'],
-                '剧场': info['theatre'],
-                '城市': info['city'],
-                '卡司': " ".join([i["artist"] for i in info['cast']])
-            })
-
-        df = pd.DataFrame(data)
-        s = "演员: {}".format(artist) + "\n" 
-        + ("从{}到{}的排期".format(start_time, end_time)) 
-        + "\n" + ("排期数量: {}".format(len(df)))
-        + df.to_string(index=False, justify='left')
+        schedule = await self.check_artist_schedule_async(start_time, end_time, artist)
+        df = schedule_to_dataframe(schedule)
+        s = ("演员: {}".format(artist) + "\n"
+             + ("从{}到{}的排期".format(start_time, end_time))
+             + "\n" + ("排期数量: {}".format(len(df)))
+             + df.to_string(index=False, justify='left'))
         return s
     
     
@@ -163,29 +278,30 @@ class SaojuDataManager(BaseDataManager):
         updated = False
         try:
             if 'artists_map' not in self.data or cast_name not in self.data['artists_map']:
-                self.data['artists_map'] = await self.fetch_saoju_artist_list()
+                await self._refresh_artists_map()
                 updated = True
         except:
-            self.data['artists_map'] = await self.fetch_saoju_artist_list()
+            await self._refresh_artists_map()
             updated = True
         if updated and cast_name not in self.data['artists_map']:
             return False
         else:
             pk = self.data['artists_map'][cast_name]
-        html_data = await fetch_page_async(f"http://y.saoju.net/yyj/artist/{pk}/?other=1&musical=")
+        async with self._request_limit:
+            html_data = await fetch_page_async(f"http://y.saoju.net/yyj/artist/{pk}/?other=1&musical=", await self._get_session())
         events = self.parse_artist_html(html_data)
         return events
     
     async def match_co_casts(self, co_casts: list, show_others=True, return_data=False):
         search_name = co_casts[0]
-        _co_casts = co_casts[1:]
+        co_set = frozenset(co_casts[1:])
         events = await self.get_artist_events_data(search_name)
         result = []
         latest = ""
         for event in events:
             others = event['others'].split(" ")
-            if all(cast in others for cast in _co_casts): 
-                others = [item for item in others if item not in _co_casts]
+            if co_set.issubset(others):
+                event['others'] = [item for item in others if item not in co_set]
                 dt = event['date']
                 event['date'] = standardize_datetime_for_saoju(dt, return_str=True, latest_str=latest)
                 latest = dt
@@ -207,11 +323,17 @@ class SaojuDataManager(BaseDataManager):
         return messages
 
     async def request_co_casts_data(self, co_casts: list, show_others=False):
-        return self.match_co_casts(co_casts, show_others, return_data=True)
+        return await self.match_co_casts(co_casts, show_others, return_data=True)
         
     
     async def fetch_saoju_artist_list(self):
-        data = json.loads(await fetch_page_async("http://y.saoju.net/yyj/api/artist/"))
+        session = await self._get_session()
+        async with self._request_limit:
+            async with session.get("http://y.saoju.net/yyj/api/artist/") as response:
+                response.raise_for_status()
+                # 直接取原始字节交给解析器，省去先解码成 str 的整份拷贝
+                raw = await response.read()
+        data = await asyncio.to_thread(json_loads, raw)
         name_to_pk = {item["fields"]["name"]: item["pk"] for item in data}
         return name_to_pk
 
@@ -251,12 +373,53 @@ class SaojuDataManager(BaseDataManager):
 
     
     
-async def fetch_page_async(url):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            return await response.text()    
+def schedule_to_dataframe(schedule):
+    """
+    将 [(开演时间, 场次)] 排期转换为 DataFrame
+    按列收集后一次性以列字典构建，避免逐行 dict 的慢速构造路径
+    """
+    dates, musicals, times, theatres, cities, casts = [], [], [], [], [], []
+    for date, info in schedule:
+        dates.append(date)
+        musicals.append(info['musical'])
+        times.append(info['time'])
+        theatres.append(info['theatre'])
+        cities.append(info['city'])
+        casts.append(" ".join([i["artist"] for i in info['cast']]))
+    return pd.DataFrame({
+        '日期': list(pd.DatetimeIndex(dates).strftime('%Y-%m-%d %H:%M')),
+        '剧名': musicals,
+        '时间': times,
+        '剧场': theatres,
+        '城市': cities,
+        '卡司': casts,
+    })
+
+async def fetch_page_async(url, session=None):
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                return await response.text()
+    async with session.get(url) as response:
+        return await response.text()
     
-def match_artists_on_schedule(
+def _slot_is_busy(times, cities, slot_ts, target_city, min_gap_seconds, cross_city_gap_seconds):
+    """
+    times: 当天按时间排序的演出时间戳，cities: 对应城市
+    同城演出间隔小于 min_gap_seconds、异地演出间隔小于 cross_city_gap_seconds 即视为冲突
+    """
+    # 时间间隔小于较大阈值的演出才可能冲突，二分只取出这个窗口内的演出
+    max_gap_seconds = max(min_gap_seconds, cross_city_gap_seconds)
+    lo = bisect_left(times, slot_ts - max_gap_seconds)
+    hi = bisect_right(times, slot_ts + max_gap_seconds)
+    for i in range(lo, hi):
+        need_gap = min_gap_seconds if cities[i] == target_city else cross_city_gap_seconds
+        if abs(slot_ts - times[i]) < need_gap:
+            return True
+    return False
+
+async def match_artists_on_schedule_async(
+    manager: "SaojuDataManager",
     artists, 
     start_time, 
     end_time, 
@@ -266,59 +429,53 @@ def match_artists_on_schedule(
     cross_city_gap_hours=15
 ):
     """
+    manager: 用于查询排期的 SaojuDataManager，各演员的排期在同一事件循环中并发获取并共用其会话
     week_time_slots: 长度为7的列表，每个元素为当天需要判断的时间点字符串列表（如["20:00"]或["14:00","17:00","20:00"]）
     min_gap_hours: 同城赶场所需最少小时数
     target_city: 目标演出城市
     cross_city_gap_hours: 跨城市赶场所需最少小时数
     """
     timetable = delta_time_list(start_time, end_time)
-    # 构建每个演员的排期字典: {artist: {date: [(datetime, city)]}}
+    # 构建每个演员的排期: {artist: {date: (按时间排序的时间戳列表, 对应城市列表)}}
     artist_schedules = {}
-    for artist in artists:
-        schedule = search_artist_from_timetable(artist, timetable)
-        daily_events = {}
+    schedules = await asyncio.gather(*(manager.search_artist_from_timetable_async(artist, timetable) for artist in artists))
+    for artist, schedule in zip(artists, schedules):
+        daily_events = defaultdict(list)
         for show_time, info in schedule:
-            date_str = dateToStr(date=show_time)
-            city = info.get("city", "")
-            if date_str not in daily_events:
-                daily_events[date_str] = []
-            daily_events[date_str].append((show_time, city))
-        artist_schedules[artist] = daily_events
-
-    free_slots = []
+            daily_events[_date_str_cached(show_time)].append((show_time.timestamp(), info.get("city", "")))
+        artist_schedules[artist] = {
+            date_str: (tuple(t for t, _ in events), tuple(c for _, c in events))
+            for date_str, events in ((d, sorted(e)) for d, e in daily_events.items())
+        }
+
+    min_gap_seconds = min_gap_hours * 3600
+    cross_city_gap_seconds = cross_city_gap_hours * 3600
+    # 时间点字符串只解析一次
+    parsed_slots = {
+        slot_time_str: datetime.strptime(slot_time_str, "%H:%M").time()
+        for day_slots in week_time_slots for slot_time_str in day_slots
+    }
+
+    weekday_labels = ("一", "二", "三", "四", "五", "六", "日")
+    free_dates, free_weekdays, free_times = [], [], []
     for date in timetable:
         date_str = date.strftime("%Y-%m-%d")
         weekday = date.weekday()  # 0=周一, 6=周日
+        day_events = [artist_schedules[artist].get(date_str) for artist in artists]
         for slot_time_str in week_time_slots[weekday]:
-            slot_time = datetime.strptime(slot_time_str, "%H:%M").time()
-            slot_dt = datetime.combine(date, slot_time)
-            all_free = True
-            for artist in artists:
-                busy = False
-                events = artist_schedules[artist].get(date_str, [])
-                for event_time, event_city in events:
-                    # 计算时间间隔
-                    delta_hours = abs((slot_dt - event_time).total_seconds()) / 3600
-                    if event_city == target_city:
-                        need_gap = min_gap_hours
-                    else:
-                        need_gap = cross_city_gap_hours
-                    if delta_hours < need_gap:
-                        busy = True
-                        break
-                if busy:
-                    all_free = False
-                    break
-            if all_free:
-                free_slots.append({"日期": date_str, "时间": slot_time_str})
-
-    df = pd.DataFrame(free_slots)
+            slot_ts = datetime.combine(date, parsed_slots[slot_time_str]).timestamp()
+            if not any(
+                events and _slot_is_busy(events[0], events[1], slot_ts, target_city, min_gap_seconds, cross_city_gap_seconds)
+                for events in day_events
+            ):
+                free_dates.append(date_str)
+                free_weekdays.append(weekday_labels[weekday])
+                free_times.append(slot_time_str)
+
+    # “星期”列在遍历日期时已知，直接随行收集，无需再逐行解析日期字符串
+    df = pd.DataFrame({"日期": free_dates, "星期": free_weekdays, "时间": free_times})
     if not df.empty:
         df = df.sort_values(by=["日期", "时间"]).reset_index(drop=True)
-        # 增加“星期”列
-        df["星期"] = df["日期"].apply(lambda x: ["一", "二", "三", "四", "五", "六", "日"][datetime.strptime(x, "%Y-%m-%d").weekday()])
-        # 调整列顺序
-        df = df[["日期", "星期", "时间"]]
     print("演员: {}".format(", ".join(artists)))
     print("所有演员都空闲的指定时间段日期：")
     print(df)
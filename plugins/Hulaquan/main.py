@@ -1,6 +1,7 @@
 from datetime import timedelta
 import traceback, time, asyncio, re
 import functools
+from collections import defaultdict
 from ncatbot.plugin import BasePlugin, CompatibleEnrollment, Event
 from ncatbot.core import GroupMessage, PrivateMessage, BaseMessage
 from .Exceptions import RequestTimeoutException
@@ -146,6 +147,8 @@ class Hulaquan(BasePlugin):
         self.remove_scheduled_task("呼啦圈上新提醒")
         self.stop_hulaquan_announcer()
         await self.save_data_managers(on_close=True)
+        await Hlq.aclose()
+        await Saoju.aclose()
         return await super().on_close(*arg, **kwd)
     
     async def _hulaquan_announcer_loop(self):
@@ -549,7 +552,8 @@ class Hulaquan(BasePlugin):
         return True
 
     def __generate_announce_text(self, MODE, event_id_to_ticket_ids, event_msgs, PREFIXES, categorized, tickets, user_id, user, is_group=False):
-        announce = {} # event_id: {ticket_id: msg}, ...
+        # event_id: {stat: {ticket_id, ...}}，按需创建内层容器，不必每条场次都分配一次默认值
+        announce = defaultdict(lambda: defaultdict(set))
         all_mode = int(user.get("attention_to_hulaquan", 0))
         if not is_group:
             fo_events = User.subscribe_events(user_id)
@@ -558,13 +562,12 @@ class Hulaquan(BasePlugin):
                 eid = event['id']
                 e_mode = int(event['mode'])
                 if eid in event_id_to_ticket_ids:
-                    announce.setdefault(eid, {})
+                    stats = announce[eid]
                     for tid in event_id_to_ticket_ids[eid]:
                         ticket = tickets[tid]
                         stat = ticket['categorized']
                         if e_mode >= MODE.get(stat, 99):
-                            announce[eid].setdefault(stat, set())
-                            announce[eid][stat].add(tid)
+                            stats[stat].add(tid)
             for t in fo_tickets:
                 tid = t['id']
                 e_mode = int(t['mode'])
@@ -573,8 +576,6 @@ class Hulaquan(BasePlugin):
                     eid = ticket['event_id']
                     stat = ticket['categorized']
                     if e_mode >= MODE.get(stat, 99):
-                        announce.setdefault(eid, {})
-                        announce[eid].setdefault(stat, set())
                         announce[eid][stat].add(tid)
         for stat, tid_s in categorized.items():
             if all_mode >= MODE.get(stat, 99):
@@ -582,8 +583,6 @@ class Hulaquan(BasePlugin):
                     ticket = tickets[tid]
                     eid = ticket['event_id']
                     stat = ticket['categorized']
-                    announce.setdefault(eid, {})
-                    announce[eid].setdefault(stat, set())
                     announce[eid][stat].add(tid)
         messages = []
         for eid, stats in announce.items():
@@ -1715,12 +1714,10 @@ class Hulaquan(BasePlugin):
         
         if _tickets:
             lines.append("\n【关注的场次】")
-            tickets = sorted(_tickets, key=lambda x: int(x['id']))
-            from itertools import groupby
-            tickets = {
-                key: sorted(list(group), key=lambda x: int(x['id']))
-                for key, group in groupby(_tickets, key=lambda x: x['mode'])
-            }
+            # 按 ID 只排序一次，再按模式分桶；各桶内保持 ID 顺序
+            tickets = {}
+            for t in sorted(_tickets, key=lambda x: int(x['id'])):
+                tickets.setdefault(t['mode'], []).append(t)
             for mode in tickets:
                 lines.append(MODES[int(mode)])
                 for t in tickets[mode]:
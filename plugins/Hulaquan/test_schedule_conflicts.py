@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对比 match_artists_on_schedule_async 中二分查找的冲突判断与原先逐场扫描的结果
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from plugins.Hulaquan.SaojuDataManager import _slot_is_busy
+
+TARGET_CITY = "上海"
+CITIES = [TARGET_CITY, "北京", "广州"]
+
+
+def _linear_is_busy(events, slot_dt, min_gap_hours, cross_city_gap_hours):
+    """原实现：逐场计算间隔小时数"""
+    for event_time, event_city in events:
+        delta_hours = abs((slot_dt - event_time).total_seconds()) / 3600
+        need_gap = min_gap_hours if event_city == TARGET_CITY else cross_city_gap_hours
+        if delta_hours < need_gap:
+            return True
+    return False
+
+
+def test_slot_is_busy_matches_linear_scan(rounds=20000, seed=0):
+    rng = random.Random(seed)
+    day = datetime(2025, 6, 1)
+    for _ in range(rounds):
+        # 两个阈值的大小关系也随机，覆盖同城阈值大于异地阈值的情况
+        min_gap_hours = rng.choice([0, 1, 2, 4, 6, 15])
+        cross_city_gap_hours = rng.choice([0, 1, 4, 15, 24])
+        events = sorted(
+            (day + timedelta(minutes=rng.randrange(0, 24 * 60, 30)), rng.choice(CITIES))
+            for _ in range(rng.randint(0, 6))
+        )
+        slot_dt = day + timedelta(minutes=rng.randrange(0, 24 * 60, 30))
+        times = tuple(t.timestamp() for t, _ in events)
+        cities = tuple(c for _, c in events)
+        expected = _linear_is_busy(events, slot_dt, min_gap_hours, cross_city_gap_hours)
+        actual = _slot_is_busy(
+            times, cities, slot_dt.timestamp(), TARGET_CITY, min_gap_hours * 3600, cross_city_gap_hours * 3600
+        )
+        assert actual == expected, (events, slot_dt, min_gap_hours, cross_city_gap_hours)
+
+
+if __name__ == "__main__":
+    test_slot_is_busy_matches_linear_scan()
+    print("✅ 二分冲突判断与逐场扫描结果一致")
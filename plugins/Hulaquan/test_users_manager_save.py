@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UsersManager 增量保存测试：首次保存后依次执行各修改方法，每次保存的文件内容都应与完整序列化一致，
+订阅索引（_ticket_index / _event_index / _actor_index）应与列表中的实际位置一致
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+
+from plugins.AdminPlugin.UsersManager import UsersManager, _SUBSCRIBE_INDEX_KEYS, _subscribe_entry_key
+
+
+def _check_indexes(um):
+    """已建立的索引须与按列表顺序重建的结果相同（重复键指向第一条）"""
+    for user_id, user in um.data["users"].items():
+        sub = user.get("subscribe") or {}
+        for list_key, index_key in _SUBSCRIBE_INDEX_KEYS.items():
+            index = sub.get(index_key)
+            if index is None:
+                continue
+            expected = {}
+            for pos, entry in enumerate(sub.get(list_key, [])):
+                expected.setdefault(_subscribe_entry_key(list_key, entry), pos)
+            assert index == expected, (user_id, list_key, index, expected)
+
+
+async def _save_and_compare(um, step):
+    await um.save()
+    with open(um.file_path, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    expected = json.loads(json.dumps(um._serialize(um.data), ensure_ascii=False))
+    assert saved == expected, step
+    # 运行时索引不应写入文件
+    for user in saved["users"].values():
+        assert not any(k.startswith("_") for k in user.get("subscribe", {})), step
+    _check_indexes(um)
+
+
+async def _run_mutations(um):
+    await _save_and_compare(um, "initial")
+    steps = [
+        ("add_ticket_subscribe", lambda: um.add_ticket_subscribe("1001", [11, 12, 13, 14], 1)),
+        ("add_ticket_subscribe(actors)", lambda: um.add_ticket_subscribe("1001", 15, 2, related_to_actors=["张三", "李四"])),
+        ("add_event_subscribe", lambda: um.add_event_subscribe("1001", [1, 2, 3, 4], 1)),
+        ("add_event_subscribe(other user)", lambda: um.add_event_subscribe("1002", [2, 5], 3)),
+        ("add_actor_subscribe", lambda: um.add_actor_subscribe("1001", ["张三", "李四", "王五"], 1, include_events=[1])),
+        ("remove_ticket_subscribe(middle)", lambda: um.remove_ticket_subscribe("1001", 12)),
+        ("remove_event_subscribe(head)", lambda: um.remove_event_subscribe("1001", 1)),
+        ("update_ticket_subscribe_mode", lambda: um.update_ticket_subscribe_mode("1001", 14, 3)),
+        ("update_event_subscribe_mode", lambda: um.update_event_subscribe_mode("1001", 3, 2)),
+        ("update_actor_subscribe_mode", lambda: um.update_actor_subscribe_mode("1001", " 王五 ", 2)),
+        ("add_actor_to_ticket_relation", lambda: um.add_actor_to_ticket_relation("1001", 11, "王五")),
+        ("touch_user(existing)", lambda: [um.touch_user("1001") for _ in range(3)]),
+        ("touch_user(new)", lambda: um.touch_user("1003")),
+        ("new_subscribe", lambda: um.new_subscribe("1003", True)),
+        ("migrate_event_subscriptions(rename)", lambda: um.migrate_event_subscriptions("3", "30")),
+        ("migrate_event_subscriptions(merge)", lambda: um.migrate_event_subscriptions("2", "5")),
+        ("remove_actor_subscribe", lambda: um.remove_actor_subscribe("1001", "张三")),
+        ("remove_actor_subscribe(last actor)", lambda: um.remove_actor_subscribe("1001", "李四")),
+        ("add_op", lambda: um.add_op("1002")),
+        ("add_op(new user)", lambda: um.add_op("1004")),
+        ("de_op", lambda: um.de_op("1004")),
+        ("switch_attention_to_hulaquan", lambda: um.switch_attention_to_hulaquan("1002", 2)),
+        ("delete_user", lambda: um.delete_user("1004")),
+    ]
+    for step, mutate in steps:
+        mutate()
+        await _save_and_compare(um, step)
+
+    sub = um.data["users"]["1001"]["subscribe"]
+    # 删除后其余条目保持原顺序
+    assert [t["id"] for t in sub["subscribe_tickets"]] == ["11", "13", "14"]
+    assert [e["id"] for e in sub["subscribe_events"]] == ["5", "30", "4"]
+    assert [a["actor_key"] for a in sub["subscribe_actors"]] == ["王五"]
+    assert [e["id"] for e in um.data["users"]["1002"]["subscribe"]["subscribe_events"]] == ["5"]
+    assert um.data["users"]["1001"]["chats_count"] == 3
+    assert um.is_event_subscribed("1001", 30) and not um.is_event_subscribed("1001", 3)
+
+
+def test_incremental_save_matches_full_serialize():
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, "UsersManager.json")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("{}")
+        # UsersManager 为单例，丢弃已有实例以使用临时文件
+        if "_instance" in UsersManager.__dict__:
+            del UsersManager._instance
+        um = UsersManager(file_path)
+        try:
+            asyncio.run(_run_mutations(um))
+        finally:
+            del UsersManager._instance
+
+
+if __name__ == "__main__":
+    test_incremental_save_matches_full_serialize()
+    print("✅ 增量保存内容与完整序列化一致，订阅索引与列表位置一致")
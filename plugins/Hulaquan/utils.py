@@ -3,6 +3,23 @@ import unicodedata
 import traceback
 import random
 import re
+import json
+
+# orjson 为可选加速依赖，未安装时退回标准库 json；各数据管理器统一经由这里解析/序列化 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_loads(raw):
+    """解析 json 文本或字节"""
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def json_dumps_bytes(obj):
+    """序列化为 utf-8 字节（不缩进，允许非字符串键）"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
 
 def dateToStr(date):
     if isinstance(date, datetime):
@@ -37,15 +54,38 @@ def delta_time_list(start_date, end_date):
             current_date += timedelta(days=1)
         return date_list   
     
+def _is_wide_char(char):
+    # 判断字符是否是全宽字符（通常是中文等）
+    return unicodedata.east_asian_width(char) in ('F', 'W') or char in ("《", "》")  # 'F' = Fullwidth, 'W' = Wide
+
+def _build_wide_bmp_pattern():
+    # 将基本多文种平面内的全宽字符合并为区间，编译成一个字符类
+    ranges = []
+    start = None
+    for i in range(0x10000):
+        if _is_wide_char(chr(i)):
+            if start is None:
+                start = i
+        elif start is not None:
+            ranges.append((start, i - 1))
+            start = None
+    if start is not None:
+        ranges.append((start, 0xFFFF))
+    return re.compile("[" + "".join(
+        re.escape(chr(a)) if a == b else f"{re.escape(chr(a))}-{re.escape(chr(b))}" for a, b in ranges
+    ) + "]")
+
+# 导入时构建一次，之后由正则引擎在 C 层统计全宽字符数，无需逐字符查询 unicodedata
+_WIDE_BMP_RE = _build_wide_bmp_pattern()
+_ASTRAL_RE = re.compile("[\U00010000-\U0010FFFF]")
+
 def get_display_width(s):
-    width = 0
-    for char in s:
-        # 判断字符是否是全宽字符（通常是中文等）
-        if unicodedata.east_asian_width(char) in ['F', 'W'] or char in ["《", "》"]:  # 'F' = Fullwidth, 'W' = Wide
-            width += 3  # 全宽字符占用2个位置
-        else:
-            width += 1  # 半宽字符占用1个位置
-    return width
+    # 全宽字符占用3个位置，半宽字符占用1个位置
+    if s.isascii():
+        return len(s)
+    if _ASTRAL_RE.search(s):
+        return sum(3 if _is_wide_char(char) else 1 for char in s)
+    return len(s) + 2 * len(_WIDE_BMP_RE.findall(s))
     
 def ljust_for_chinese(s, width, fillchar=' '):
     current_width = get_display_width(s)